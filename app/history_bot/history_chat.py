@@ -1,17 +1,24 @@
 from dotenv import load_dotenv
 import os
-import openai
 import sys
 import json
 
+from common.llm_clients import get_client
+
 load_dotenv(dotenv_path='../../.env')
 
-# 配置OpenAI客户端
-openai.api_key = os.environ.get("API_KEY")
-openai.base_url = os.environ.get("BASE_URL") + "/"
-openai.api_type = "openai"
+# 聊天模型，客户端通过共享的客户端工厂获取
 deployment_name = os.environ.get("MODEL")
 
+def build_messages(person, question):
+    """
+    构建发送给LLM的消息
+    """
+    prompt = f"""
+    你将扮演历史上的人物：{person}。请根据你的身份回答以下问题：{question}。请用中文回答。
+    """
+    return [{"role": "user", "content": prompt}]
+
 def chat_with_history_bot(person, question):
     """
     与历史人物聊天的核心函数
@@ -21,12 +28,8 @@ def chat_with_history_bot(person, question):
     Returns:
         历史人物的回答
     """
-    prompt = f"""
-    你将扮演历史上的人物：{person}。请根据你的身份回答以下问题：{question}。请用中文回答。
-    """
-
-    message = [{"role": "user", "content": prompt}]
-    completion = openai.chat.completions.create(
+    message = build_messages(person, question)
+    completion = get_client("deepseek").chat.completions.create(
         model=deployment_name, 
         messages=message, 
         max_tokens=500, 
@@ -34,7 +37,40 @@ def chat_with_history_bot(person, question):
     )
     return completion.choices[0].message.content
 
+def chat_with_history_bot_stream(person, question):
+    """
+    流式版本的聊天函数，逐段产出历史人物的回答
+    Args:
+        person: 历史人物名称
+        question: 用户问题
+    Returns:
+        生成器，每次产出一段新增的回答文本
+    """
+    stream = get_client("deepseek").chat.completions.create(
+        model=deployment_name, 
+        messages=build_messages(person, question), 
+        max_tokens=500, 
+        temperature=0.5,
+        stream=True
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
 if __name__ == "__main__":
+    # 流式模式：逐行输出 {"delta": "..."}，最后输出 {"done": true}
+    if len(sys.argv) > 3 and sys.argv[1] == "--stream":
+        try:
+            for delta in chat_with_history_bot_stream(sys.argv[2], sys.argv[3]):
+                print(json.dumps({"delta": delta}), flush=True)
+            print(json.dumps({"done": True}), flush=True)
+        except Exception as e:
+            print(json.dumps({"error": str(e)}), flush=True)
+        sys.exit(0)
+
     # 从命令行获取参数
     if len(sys.argv) < 3:
         print(json.dumps({"error": "缺少参数：需要历史人物名称和问题"}))
@@ -13,6 +13,25 @@ const PORT = process.env.PORT || 3000;
 app.use(express.json());
 app.use(express.static(path.join(__dirname, '../public')));
 
+// 客户端通过 Accept: text/event-stream 请求流式回答
+function wantsStream(req: Request): boolean {
+  return (req.headers.accept || '').includes('text/event-stream');
+}
+
+function startSse(res: Response) {
+  res.writeHead(200, {
+    'Content-Type': 'text/event-stream; charset=utf-8',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive'
+  });
+}
+
+function sendSse(res: Response, payload: object) {
+  if (!res.writableEnded) {
+    res.write(`data: ${JSON.stringify(payload)}\n\n`);
+  }
+}
+
 // 聊天API端点
 app.post('/api/chat', (req: Request, res: Response) => {
   try {
@@ -22,6 +41,41 @@ app.post('/api/chat', (req: Request, res: Response) => {
       return res.status(400).json({ error: '缺少必要参数：person 和 question' });
     }
     
+    // 流式模式：把 Python 脚本逐行输出的增量回答以 Server-Sent Events 转发给浏览器
+    if (wantsStream(req)) {
+      startSse(res);
+      const shell = new PythonShell(path.join(__dirname, '../history_chat.py'), {
+        mode: 'json',
+        args: ['--stream', person, question],
+        pythonPath: 'python' // 或者指定具体的Python路径
+      });
+      let failed = false;
+      shell.on('message', (message: { delta?: string; error?: string }) => {
+        if (message.delta !== undefined) {
+          sendSse(res, { delta: message.delta });
+        } else if (message.error) {
+          failed = true;
+          sendSse(res, { error: message.error });
+        }
+      });
+      shell.end((err) => {
+        if (err && !failed) {
+          console.error('Python脚本执行错误:', err);
+          sendSse(res, { error: err.message });
+        } else if (!failed) {
+          sendSse(res, { done: true });
+        }
+        res.end();
+      });
+      // 客户端断开时结束 Python 进程
+      res.on('close', () => {
+        if (!shell.terminated) {
+          shell.kill();
+        }
+      });
+      return;
+    }
+    
     // 调用Python脚本
     const options = {
       args: [person, question],
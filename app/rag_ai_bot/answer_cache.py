@@ -0,0 +1,125 @@
+# 语义回答缓存
+# 以问题向量为键缓存LLM的回答：新问题与已缓存问题的余弦相似度超过阈值、
+# 并且检索到的文档指纹相同时直接返回缓存的回答，文档内容变化后旧回答自动失效
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def context_fingerprint(ids, documents):
+    """
+    计算检索结果的指纹（文档ID和内容），检索到的上下文变化时指纹随之变化
+    """
+    digest = hashlib.sha256()
+    for doc_id, document in zip(ids, documents):
+        digest.update(doc_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update((document or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    带TTL和容量上限(LRU)的语义回答缓存
+    Args:
+        threshold: 余弦相似度阈值，达到该值视为同一个问题
+        ttl: 缓存条目有效期（秒）
+        max_entries: 最多缓存的回答数
+    """
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (单位向量, 指纹, 回答, 过期时间)
+        self._by_fingerprint = {}      # 指纹 -> 条目key集合，只在指纹相同的条目里比较相似度
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding, fingerprint):
+        """
+        查找相似问题的缓存回答
+        Args:
+            embedding: 问题向量
+            fingerprint: 检索结果指纹
+        Returns:
+            命中时返回缓存的回答，否则返回None
+        """
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for key in list(self._by_fingerprint.get(fingerprint, ())):
+                cached_vector, _, _, expires = self._entries[key]
+                if expires <= now:
+                    self._remove(key)
+                    continue
+                score = float(np.dot(vector, cached_vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][2]
+
+    def store(self, embedding, fingerprint, answer):
+        """
+        缓存一个回答，超过容量时淘汰最久未使用的条目
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (vector, fingerprint, answer, time.monotonic() + self.ttl)
+            self._by_fingerprint.setdefault(fingerprint, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        """
+        返回命中统计
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def _remove(self, key):
+        _, fingerprint, _, _ = self._entries.pop(key)
+        keys = self._by_fingerprint[fingerprint]
+        keys.discard(key)
+        if not keys:
+            del self._by_fingerprint[fingerprint]
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def create_answer_cache():
+    """
+    按环境变量创建回答缓存，ANSWER_CACHE_SIZE 设置为0时禁用缓存
+    """
+    max_entries = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+    if max_entries <= 0:
+        return None
+    return SemanticAnswerCache(
+        threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")),
+        ttl=float(os.environ.get("ANSWER_CACHE_TTL", "3600")),
+        max_entries=max_entries
+    )
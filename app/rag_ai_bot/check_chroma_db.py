@@ -1,65 +1,171 @@
+# 只读查看Chroma数据库结构
+# 信息全部来自 collection.get(include=["embeddings"/"metadatas"]) 和磁盘上的存储文件：
+# 向量维度、向量数量、向量范数统计、每个元数据字段的取值数量、索引的磁盘占用和抽样最近邻查询延迟。
+# 打开集合时不绑定嵌入函数，查询只使用已存储的向量，不会修改集合，也不会调用嵌入接口
+#
+# 用法：
+#   python check_chroma_db.py                        # 查看所有集合
+#   python check_chroma_db.py --collection oscar_awards --sample 500
+
+import argparse
+import os
+import sqlite3
+import time
+from collections import Counter, defaultdict
+
 import chromadb
-import json
-
-# 连接到chroma_db
-print("正在连接到chroma_db...")
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-print("连接成功")
-
-# 获取所有集合
-print("\n获取所有集合...")
-collections = chroma_client.list_collections()
-print(f"共找到 {len(collections)} 个集合")
-
-# 遍历每个集合，查看详细信息
-for collection in collections:
-    print(f"\n=== 集合信息 ===")
-    print(f"集合名称: {collection.name}")
-    print(f"集合元数据: {collection.metadata}")
-    print(f"文档数量: {collection.count()}")
-    
-    # 查看集合中的文档
-    print(f"\n=== 文档示例 (前3个) ===")
-    results = collection.query(
-        query_texts=["test"],
-        n_results=3,
-        include=["documents", "metadatas", "distances"]
-    )
-    
-    # 打印查询结果
-    print(f"查询结果: {json.dumps(results, indent=2, ensure_ascii=False)}")
-    
-    # 查看集合中的嵌入向量信息
-    print(f"\n=== 嵌入向量信息 ===")
-    # Chroma Python客户端没有直接获取嵌入向量的方法
-    # 我们可以通过添加一个测试文档来间接了解
-    
+import numpy as np
+
+from chroma_utils import collection_names, get_search_ef, iter_collection
+
+CHROMA_PATH = "./chroma_db"
+
+
+def directory_size(path):
+    """
+    统计目录下所有文件的总字节数
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def load_segments(path=CHROMA_PATH):
+    """
+    以只读方式打开 chroma.sqlite3，读取集合ID -> [(段ID, 段类型)] 的映射
+    找不到数据库文件或表结构不同（其他版本的Chroma）时返回空字典
+    """
+    db_path = os.path.join(path, "chroma.sqlite3")
+    if not os.path.exists(db_path):
+        return {}
+    segments = defaultdict(list)
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
     try:
-        # 添加一个测试文档
-        test_id = "test_document"
-        collection.add(
-            documents=["这是一个测试文档"],
-            ids=[test_id]
-        )
-        
-        # 查询这个测试文档
-        test_results = collection.query(
-            query_texts=["这是一个测试文档"],
-            n_results=1,
-            include=["embeddings"]
-        )
-        
-        if "embeddings" in test_results and test_results["embeddings"]:
-            embeddings = test_results["embeddings"][0]
-            print(f"嵌入向量数量: {len(embeddings)}")
-            if embeddings:
-                print(f"嵌入向量维度: {len(embeddings[0])}")
-                print(f"嵌入向量示例: {embeddings[0][:5]}...")  # 只显示前5个元素
-        
-        # 删除测试文档
-        collection.delete(ids=[test_id])
-    except Exception as e:
-        print(f"获取嵌入向量信息失败: {e}")
-        print("无法直接获取嵌入向量信息，可能是因为Chroma客户端版本限制")
-
-print("\n=== 数据库结构查看完成 ===")
+        for segment_id, scope, collection_id in connection.execute("SELECT id, scope, collection FROM segments"):
+            segments[collection_id].append((segment_id, scope))
+    except sqlite3.Error:
+        return {}
+    finally:
+        connection.close()
+    return segments
+
+
+def sample_embeddings(collection, limit):
+    """
+    读取前 limit 条记录的ID和向量（只读）
+    """
+    result = collection.get(limit=limit, include=["embeddings"])
+    embeddings = result["embeddings"]
+    if embeddings is None or len(embeddings) == 0:
+        return result["ids"], np.zeros((0, 0), dtype=np.float32)
+    return result["ids"], np.asarray(embeddings, dtype=np.float32)
+
+
+def metadata_cardinality(collection):
+    """
+    分页读取全部元数据，统计每个字段出现的记录数和不同取值的数量
+    Returns:
+        {字段名: (出现的记录数, 不同取值数)}
+    """
+    present, values = Counter(), defaultdict(set)
+    for page in iter_collection(collection, ["metadatas"]):
+        for metadata in page["metadatas"]:
+            for field, value in (metadata or {}).items():
+                present[field] += 1
+                values[field].add(value)
+    return {field: (present[field], len(values[field])) for field in sorted(present)}
+
+
+def nearest_neighbour_latency(collection, ids, vectors, queries, k):
+    """
+    用已存储的向量作为查询，统计最近邻查询延迟，并检查第一条结果是否为查询向量本身
+    Returns:
+        (每次查询的延迟毫秒数组, 自身命中率)
+    """
+    latencies, self_hits = [], 0
+    for row in queries:
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[vectors[row].tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - started) * 1000)
+        self_hits += bool(result["ids"][0]) and result["ids"][0][0] == ids[row]
+    return np.asarray(latencies), self_hits / max(len(queries), 1)
+
+
+def inspect_collection(collection, segments, sample, queries, k):
+    """
+    打印一个集合的信息
+    """
+    count = collection.count()
+    print(f"\n=== 集合 {collection.name} ===")
+    print(f"集合ID: {collection.id}")
+    print(f"集合元数据: {collection.metadata}")
+    print(f"向量数量: {count}")
+    print(f"search_ef: {get_search_ef(collection)}")
+
+    # 磁盘占用：向量段是以段ID命名的HNSW索引目录，元数据段保存在 chroma.sqlite3 中
+    for segment_id, scope in segments.get(str(collection.id), []):
+        segment_path = os.path.join(CHROMA_PATH, segment_id)
+        if scope == "VECTOR":
+            size = directory_size(segment_path) if os.path.isdir(segment_path) else 0
+            print(f"向量索引: {segment_id} {format_size(size)}"
+                  + ("" if size else "（尚未写入磁盘）"))
+
+    ids, vectors = sample_embeddings(collection, sample)
+    if len(ids) == 0:
+        print("集合为空")
+        return
+    norms = np.linalg.norm(vectors, axis=1)
+    print(f"向量维度: {vectors.shape[1]}")
+    print(f"向量范数（前 {len(ids)} 条）: 最小 {norms.min():.4f}  平均 {norms.mean():.4f}  "
+          f"最大 {norms.max():.4f}  标准差 {norms.std():.4f}")
+    if np.allclose(norms, 1.0, atol=1e-3):
+        print("向量已归一化，cosine 与 ip 距离的排序一致")
+    print(f"向量示例: {vectors[0][:5].round(4).tolist()}...")
+
+    print("元数据字段（字段: 出现的记录数 / 不同取值数）:")
+    for field, (present, distinct) in metadata_cardinality(collection).items():
+        print(f"  {field}: {present} / {distinct}")
+
+    rows = np.random.default_rng(0).choice(len(ids), size=min(queries, len(ids)), replace=False)
+    latencies, self_hit_rate = nearest_neighbour_latency(collection, ids, vectors, rows, min(k, count))
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"最近邻查询延迟（{len(rows)} 次，k={min(k, count)}）: "
+          f"p50 {p50:.2f}ms  p95 {p95:.2f}ms  p99 {p99:.2f}ms  自身命中率 {self_hit_rate:.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="只读查看Chroma数据库结构，不修改集合、不调用嵌入接口")
+    parser.add_argument("--collection", action="append", help="只查看指定集合（可以指定多次），默认查看所有集合")
+    parser.add_argument("--sample", type=int, default=1000, help="读取向量用于统计的记录数")
+    parser.add_argument("--queries", type=int, default=50, help="测试最近邻查询延迟的查询数")
+    parser.add_argument("-k", type=int, default=10, help="最近邻查询返回的结果数")
+    args = parser.parse_args()
+
+    # 连接到chroma_db
+    print("正在连接到chroma_db...")
+    chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    print("连接成功")
+
+    sqlite_path = os.path.join(CHROMA_PATH, "chroma.sqlite3")
+    if os.path.exists(sqlite_path):
+        print(f"chroma.sqlite3（元数据和文档）: {format_size(os.path.getsize(sqlite_path))}")
+    print(f"数据库目录总大小: {format_size(directory_size(CHROMA_PATH))}")
+
+    names = args.collection or collection_names(chroma_client)
+    print(f"共 {len(names)} 个集合")
+    segments = load_segments()
+    for name in names:
+        # 不绑定嵌入函数：只读取已存储的向量，不会触发嵌入请求
+        collection = chroma_client.get_collection(name=name, embedding_function=None)
+        inspect_collection(collection, segments, args.sample, args.queries, args.k)
+
+    print("\n=== 数据库结构查看完成 ===")
@@ -1,29 +1,187 @@
+# 集合检查和HNSW参数基准测试
+# 回放一组查询，统计不同HNSW参数下的查询延迟(p50/p95/p99)，
+# 并以存储向量上的精确暴力搜索为基准计算 recall@k，用于选择速度和召回率的平衡点
+#
+# 用法：
+#   python check_collection.py                              # 用抽样的存储向量作为查询，测试当前参数
+#   python check_collection.py --ef 10,50,100,200           # 在数据库的临时副本上扫描查询时的 search_ef
+#   python check_collection.py --questions questions.jsonl  # 回放问题集（问题需要调用嵌入接口，有嵌入缓存）
+#   python check_collection.py --m 16,32 --construction-ef 100,200 --ef 50,100
+#                                                           # 用存储向量在临时目录中建临时集合，比较建索引参数
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
 import chromadb
-import sys
-
-# 初始化Chroma客户端
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-
-# 获取集合
-collection = chroma_client.get_collection(name="oscar_awards")
-
-# 打印集合信息
-print("集合名称:", collection.name)
-print("集合元数据:", collection.metadata)
-print("集合文档数量:", collection.count())
-
-# 尝试获取集合配置
-print("\n尝试获取集合配置...")
-# Chroma Python客户端没有直接获取嵌入维度的方法
-# 我们可以通过查询一个简单的文档来间接了解
-
-try:
-    # 尝试查询一个简单的文档
-    results = collection.query(
-        query_texts=["test"],
-        n_results=1
-    )
-    print("查询成功，集合配置正常")
-except Exception as e:
-    print(f"查询失败: {e}")
-    print("\n建议重新创建集合，使用正确的嵌入模型")
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+
+from chroma_utils import get_search_ef, iter_collection, set_search_ef
+
+
+def load_embeddings(collection):
+    """
+    读取集合中全部的ID和向量
+    """
+    ids, vectors = [], []
+    for page in iter_collection(collection, ["embeddings"]):
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+    return ids, np.concatenate(vectors)
+
+
+def reopen(path, name):
+    """
+    重新打开集合：search_ef 在进程加载索引时生效，修改后需要清空客户端缓存重新加载索引
+    """
+    SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(path=path).get_collection(name=name)
+
+
+def sweep(path, collection, ef_values, queries, distances, positions, k, label=""):
+    """
+    依次设置每个 search_ef 并测试，返回最后打开的集合
+    修改会持久化到 path 中的集合，只能用于临时集合或临时副本
+    """
+    for search_ef in ef_values or [get_search_ef(collection)]:
+        if search_ef is not None:
+            set_search_ef(collection, search_ef)
+            collection = reopen(path, collection.name)
+        latencies, recall = benchmark(collection, queries, distances, positions, k)
+        report(f"{label}search_ef={search_ef}", latencies, recall, k)
+    return collection
+
+
+def load_questions(path):
+    """
+    读取问题集，每行为 {"question": "..."} 或纯文本问题
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = line
+            questions.append(record.get("question", "") if isinstance(record, dict) else str(record))
+    return questions
+
+
+def exact_distances(vectors, queries, space):
+    """
+    暴力计算每个查询与全部向量的距离（与Chroma的距离定义一致）
+    """
+    dots = queries @ vectors.T
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1)
+        query_norms = np.linalg.norm(queries, axis=1)
+        return 1.0 - dots / np.maximum(np.outer(query_norms, norms), 1e-12)
+    if space == "ip":
+        return 1.0 - dots
+    return (queries ** 2).sum(axis=1)[:, None] + (vectors ** 2).sum(axis=1)[None, :] - 2.0 * dots
+
+
+def benchmark(collection, queries, distances, positions, k, warmup=5):
+    """
+    逐个回放查询，返回 (每次查询的延迟毫秒数组, 平均 recall@k)
+    召回以距离判断：结果的真实距离不超过精确第k近的距离即视为命中（避免距离相同的向量影响统计）
+    Args:
+        distances: 每个查询与全部向量的精确距离
+        positions: ID -> 向量序号
+    """
+    thresholds = np.partition(distances, k - 1, axis=1)[:, k - 1]
+    for query in queries[:warmup]:
+        collection.query(query_embeddings=[query.tolist()], n_results=k)
+    latencies, recalls = [], []
+    for query, row, threshold in zip(queries, distances, thresholds):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits = sum(1 for doc_id in result["ids"][0] if row[positions[doc_id]] <= threshold + 1e-5)
+        recalls.append(hits / k)
+    return np.asarray(latencies), float(np.mean(recalls))
+
+
+def report(label, latencies, recall, k):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"{label:<40} p50 {p50:7.2f}ms  p95 {p95:7.2f}ms  p99 {p99:7.2f}ms  recall@{k} {recall:.4f}")
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(",")] if value else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查集合并测试HNSW参数下的查询延迟和召回率")
+    parser.add_argument("--collection", default="oscar_awards", help="集合名称")
+    parser.add_argument("--questions", help="问题集文件（JSONL或每行一个问题），不指定时抽样存储向量作为查询")
+    parser.add_argument("--sample", type=int, default=200, help="不指定问题集时抽样的查询数")
+    parser.add_argument("-k", type=int, default=10, help="recall@k 的 k")
+    parser.add_argument("--ef", default="", help="要测试的 search_ef，逗号分隔")
+    parser.add_argument("--m", default="", help="要测试的 M（在临时目录中建临时集合），逗号分隔")
+    parser.add_argument("--construction-ef", default="", help="要测试的 construction_ef（在临时目录中建临时集合），逗号分隔")
+    args = parser.parse_args()
+
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    collection = chroma_client.get_collection(name=args.collection)
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+
+    # 打印集合信息
+    print("集合名称:", collection.name)
+    print("集合元数据:", collection.metadata)
+    print("集合文档数量:", collection.count())
+    print("当前 search_ef:", get_search_ef(collection))
+
+    ids, vectors = load_embeddings(collection)
+    print(f"向量维度: {vectors.shape[1]}，距离: {space}")
+
+    if args.questions:
+        from embedding import create_embedding_function
+        questions = load_questions(args.questions)
+        queries = np.asarray(create_embedding_function()(questions), dtype=np.float32)
+    else:
+        rows = random.Random(0).sample(range(len(ids)), min(args.sample, len(ids)))
+        queries = vectors[rows]
+    k = min(args.k, len(ids))
+    print(f"查询数: {len(queries)}，k={k}\n")
+
+    # 精确暴力搜索的结果作为基准
+    distances = exact_distances(vectors, queries, space)
+    positions = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    ef_values = parse_list(args.ef)
+    if args.m or args.construction_ef:
+        # 建索引参数只能在创建集合时指定：用存储的向量在临时目录中建临时集合（不调用嵌入接口）
+        base = collection.metadata or {}
+        for m in parse_list(args.m) or [base.get("hnsw:M", 16)]:
+            for construction_ef in parse_list(args.construction_ef) or [base.get("hnsw:construction_ef", 100)]:
+                with tempfile.TemporaryDirectory() as temp_path:
+                    started = time.perf_counter()
+                    temp_client = chromadb.PersistentClient(path=temp_path)
+                    temp = temp_client.create_collection(
+                        name=f"bench_m{m}_ef{construction_ef}",
+                        metadata={"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef}
+                    )
+                    batch_size = temp_client.get_max_batch_size()
+                    for start in range(0, len(ids), batch_size):
+                        temp.add(ids=ids[start:start + batch_size], embeddings=vectors[start:start + batch_size])
+                    print(f"M={m} construction_ef={construction_ef} 建索引耗时 {time.perf_counter() - started:.1f} 秒")
+                    sweep(temp_path, temp, ef_values, queries, distances, positions, k,
+                          label=f"M={m} construction_ef={construction_ef} ")
+                    SharedSystemClient.clear_system_cache()
+    else:
+        # search_ef 的修改会持久化，并影响正在查询该集合的进程：复制数据库到临时目录，在副本上测试
+        with tempfile.TemporaryDirectory() as temp_path:
+            copy_path = os.path.join(temp_path, "chroma_db")
+            shutil.copytree("./chroma_db", copy_path)
+            copy = reopen(copy_path, collection.name)
+            sweep(copy_path, copy, ef_values, queries, distances, positions, k)
+            SharedSystemClient.clear_system_cache()
@@ -0,0 +1,127 @@
+# Chroma集合的通用工具：分页读取、where条件匹配和HNSW索引参数
+
+import os
+
+# 创建集合时可配置的HNSW参数：环境变量 -> 集合元数据键
+HNSW_SETTINGS = {
+    "CHROMA_HNSW_SPACE": ("hnsw:space", str),
+    "CHROMA_HNSW_M": ("hnsw:M", int),
+    "CHROMA_HNSW_CONSTRUCTION_EF": ("hnsw:construction_ef", int),
+    "CHROMA_HNSW_SEARCH_EF": ("hnsw:search_ef", int),
+}
+
+
+def collection_names(chroma_client):
+    """
+    返回所有集合名称（兼容 list_collections 返回名称或集合对象的不同Chroma版本）
+    """
+    return [col if isinstance(col, str) else col.name for col in chroma_client.list_collections()]
+
+
+def iter_collection(collection, include, page_size=1000):
+    """
+    分页遍历集合中的全部记录
+    Args:
+        collection: Chroma集合
+        include: 需要返回的字段，例如 ["metadatas"]、["documents", "embeddings"]
+        page_size: 每页记录数
+    Returns:
+        生成器，每次产出一页 collection.get 的结果
+    """
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        if len(page["ids"]) < page_size:
+            return
+        offset += page_size
+
+
+def load_metadata_field(collection, field, page_size=1000):
+    """
+    读取集合中每条记录的某个元数据字段
+    Returns:
+        {id: 字段值} 字典，缺少该字段的记录值为None
+    """
+    values = {}
+    for page in iter_collection(collection, ["metadatas"], page_size):
+        for record_id, metadata in zip(page["ids"], page["metadatas"]):
+            values[record_id] = (metadata or {}).get(field)
+    return values
+
+
+def matches_where(metadata, where):
+    """
+    判断元数据是否满足Chroma风格的where条件（支持 $and/$or/$eq/$ne/$in/$nin/$gt/$gte/$lt/$lte）
+    """
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, sub) for sub in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, expected in condition.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if op == "$gt" and not value > expected:
+                        return False
+                    if op == "$gte" and not value >= expected:
+                        return False
+                    if op == "$lt" and not value < expected:
+                        return False
+                    if op == "$lte" and not value <= expected:
+                        return False
+    return True
+
+
+def hnsw_metadata():
+    """
+    按环境变量生成创建集合时使用的HNSW参数元数据，没有设置的参数使用Chroma默认值
+    Returns:
+        元数据字典，没有任何设置时返回None
+    """
+    metadata = {}
+    for env_name, (key, cast) in HNSW_SETTINGS.items():
+        value = os.environ.get(env_name)
+        if value:
+            metadata[key] = cast(value)
+    return metadata or None
+
+
+def get_search_ef(collection):
+    """
+    返回集合当前的 search_ef（新版Chroma从集合配置读取，旧版从元数据读取），未设置时返回None
+    """
+    configuration = getattr(collection, "configuration", None) or {}
+    hnsw = configuration.get("hnsw") if isinstance(configuration, dict) else None
+    if hnsw and hnsw.get("ef_search") is not None:
+        return hnsw["ef_search"]
+    return (collection.metadata or {}).get("hnsw:search_ef")
+
+
+def set_search_ef(collection, search_ef):
+    """
+    修改集合的 search_ef（查询时的候选列表大小），无需重建索引
+    新版Chroma通过集合配置修改，旧版通过元数据修改（保留其他元数据）；
+    修改会持久化，并在进程加载该集合的索引时生效（即在本进程第一次查询之前调用）
+    """
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    except TypeError:
+        collection.modify(metadata={**(collection.metadata or {}), "hnsw:search_ef": search_ef})
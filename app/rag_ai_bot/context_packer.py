@@ -0,0 +1,50 @@
+# 按token预算组装RAG上下文
+# 统计每个检索结果的token数，去掉近似重复的文档，按相关度顺序尽可能多地放入预算内的文档
+
+import re
+
+from document_builder import FIELD_LABELS
+from token_utils import encode_batch
+
+# 文档的字段标签是固定模板，比较相似度前去掉，只比较字段值
+LABEL_PATTERN = re.compile("|".join(re.escape(label) + r":" for label in FIELD_LABELS))
+
+
+def pack_context(ids, documents, token_budget, dedupe_threshold=0.8):
+    """
+    在token预算内挑选上下文文档
+    Args:
+        ids: 按相关度排序的文档ID
+        documents: 与ids对应的文档内容
+        token_budget: 上下文允许使用的最大token数
+        dedupe_threshold: 两个文档去掉字段标签后的token集合Jaccard相似度达到该值时视为重复
+    Returns:
+        (选中的ID列表, 选中的文档列表, 使用的token数)
+    """
+    if not documents:
+        return [], [], 0
+
+    # 文档原样放入上下文（保留换行），token数按原文计算
+    token_ids = encode_batch(documents)
+    # 两个文档是否重复只取决于它们自身，与同时检索到的其他文档无关
+    token_sets = [set(tokens) for tokens in encode_batch(LABEL_PATTERN.sub(" ", document) for document in documents)]
+
+    packed_ids, packed_documents, kept_sets = [], [], []
+    used = 0
+    for doc_id, document, tokens, token_set in zip(ids, documents, token_ids, token_sets):
+        if used + len(tokens) > token_budget:
+            # 较长的文档放不下时继续尝试后面更短的文档
+            continue
+        if any(_jaccard(token_set, kept) >= dedupe_threshold for kept in kept_sets):
+            continue
+        packed_ids.append(doc_id)
+        packed_documents.append(document)
+        kept_sets.append(token_set)
+        used += len(tokens)
+    return packed_ids, packed_documents, used
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
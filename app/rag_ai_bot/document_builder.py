@@ -0,0 +1,95 @@
+# 文档构建器
+# 分块读取奥斯卡获奖数据集CSV，用向量化的pandas/NumPy字符串操作生成文档、ID和元数据，
+# 按token数打包为嵌入请求流式产出，导入过程中内存占用保持平稳
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from token_utils import encode_batch
+
+RELEVANT_COLUMNS = ['year_ceremony', 'ceremony', 'category', 'name', 'film', 'winner']
+# 文档中每行的字段标签，按出现顺序；所有文档共有这些标签，context_packer 去重时不计入相似度
+FIELD_LABELS = ['颁奖年份', '奖项类别', '获奖者', '电影名称', '是否获奖']
+
+
+def content_hash(document, ceremony):
+    """
+    计算行的内容哈希，用于增量同步时判断该行是否发生变化
+    文档文本包含了除届次以外的全部元数据字段，因此对文档文本和届次求哈希
+    """
+    return hashlib.sha256(f"{document}\0{ceremony}".encode("utf-8")).hexdigest()[:32]
+
+
+def build_chunk(df, min_year=0):
+    """
+    对一块数据做预处理并构建文档
+    Args:
+        df: 原始数据块（保留CSV中的行号作为索引）
+        min_year: 只保留该年份及以后的数据
+    Returns:
+        (ids, documents, metadatas) 三个等长列表
+    """
+    df = df[RELEVANT_COLUMNS]
+    # 过滤掉空的film条目和其他缺失值
+    df = df[df['film'].notna() & (df['film'] != '')].dropna()
+    df = df[df['year_ceremony'] >= min_year]
+    if df.empty:
+        return [], [], []
+
+    df = df.astype({'year_ceremony': 'int64', 'ceremony': 'int64', 'category': str, 'name': str, 'film': str, 'winner': bool})
+    winner_text = pd.Series(np.where(df['winner'], '是', '否'), index=df.index)
+    values = [df['year_ceremony'].astype(str), df['category'], df['name'], df['film'], winner_text]
+    documents = pd.Series("", index=df.index)
+    for label, value in zip(FIELD_LABELS, values):
+        documents = documents + label + ": " + value + "\n"
+    documents = documents.tolist()
+    ids = ("oscar_" + df.index.astype(str)).tolist()
+
+    metadatas = df.to_dict("records")
+    for metadata, document in zip(metadatas, documents):
+        metadata['content_hash'] = content_hash(document, metadata['ceremony'])
+    return ids, documents, metadatas
+
+
+def iter_document_chunks(csv_path, min_year=0, chunk_size=5000):
+    """
+    分块读取CSV并逐块构建文档
+    Args:
+        csv_path: 数据集CSV路径
+        min_year: 只保留该年份及以后的数据
+        chunk_size: 每次从CSV读取的行数
+    Returns:
+        生成器，每次产出一块数据的 (ids, documents, metadatas)
+    """
+    reader = pd.read_csv(csv_path, usecols=RELEVANT_COLUMNS, chunksize=chunk_size)
+    return (build_chunk(chunk, min_year) for chunk in reader)
+
+
+def pack_by_tokens(batches, max_inputs, max_tokens):
+    """
+    按token数把文档打包为嵌入请求：每个请求不超过 max_inputs 条文档、不超过 max_tokens 个token
+    每块文档用 encode_batch 一次性计算token数；单条文档超过 max_tokens 时单独作为一个请求
+    Args:
+        batches: 可迭代对象，每个元素为 (ids, documents, metadatas)
+        max_inputs: 每个请求最多的文档数
+        max_tokens: 每个请求最多的token数
+    Returns:
+        生成器，每次产出 (ids, documents, metadatas, 请求的token数)
+    """
+    ids, documents, metadatas, request_tokens = [], [], [], 0
+    for batch_ids, batch_documents, batch_metadatas in batches:
+        if not batch_ids:
+            continue
+        token_counts = [len(tokens) for tokens in encode_batch(batch_documents)]
+        for doc_id, document, metadata, tokens in zip(batch_ids, batch_documents, batch_metadatas, token_counts):
+            if ids and (len(ids) >= max_inputs or request_tokens + tokens > max_tokens):
+                yield ids, documents, metadatas, request_tokens
+                ids, documents, metadatas, request_tokens = [], [], [], 0
+            ids.append(doc_id)
+            documents.append(document)
+            metadatas.append(metadata)
+            request_tokens += tokens
+    if ids:
+        yield ids, documents, metadatas, request_tokens
@@ -0,0 +1,69 @@
+# 自定义OpenAI嵌入函数
+# load_data.py 和 rag_chat.py 共用，保证导入和查询使用相同的向量空间，
+# 并通过本地嵌入缓存避免重复调用嵌入API
+
+import os
+
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from embedding_cache import default_cache, normalize_text
+
+from common.llm_clients import get_client
+
+# 通义千问 text-embedding-v2 单次请求最多25条文本
+DEFAULT_MAX_INPUTS = 25
+
+
+class OpenAIEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, cache=None, max_retries=2):
+        # 初始化方法，满足Chroma未来版本的要求
+        self.model = os.environ.get("RAG_MODEL") or "text-embedding-v2"
+        self.cache = cache
+        self.max_retries = max_retries
+        self._client = None
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        if self.cache is None:
+            return self._embed(texts)
+
+        embeddings = self.cache.get_many(self.model, texts)
+        # 规范化后相同的文本只请求一次
+        missing = {}
+        for text, vector in zip(texts, embeddings):
+            if vector is None:
+                missing.setdefault(normalize_text(text), text)
+        if missing:
+            vectors = self._embed(list(missing.values()))
+            self.cache.put_many(self.model, list(missing.values()), vectors)
+            by_key = dict(zip(missing, vectors))
+            embeddings = [by_key[normalize_text(text)] if vector is None else vector
+                          for text, vector in zip(texts, embeddings)]
+        return embeddings
+
+    def _embed(self, texts):
+        # 调用OpenAI API生成嵌入（使用OpenAI 1.0.0+新API格式）
+        # 复用共享客户端的连接池，只覆盖重试次数
+        if self._client is None:
+            self._client = get_client("qwen").with_options(max_retries=self.max_retries)
+        response = self._client.embeddings.create(
+            model=self.model,
+            input=texts
+        )
+        # 提取嵌入向量
+        return [item.embedding for item in response.data]
+
+
+def max_embed_inputs():
+    """
+    每个嵌入请求最多包含的文本数，导入（load_data.py）和批量问答（rag_chat.py）共用
+    读取 EMBED_MAX_INPUTS（未设置时兼容旧的 EMBED_BATCH_SIZE）；在调用时读取，以便调用方先加载 .env
+    """
+    return int(os.environ.get("EMBED_MAX_INPUTS", os.environ.get("EMBED_BATCH_SIZE", DEFAULT_MAX_INPUTS)))
+
+
+def create_embedding_function(max_retries=2):
+    """
+    创建带默认嵌入缓存的嵌入函数
+    """
+    return OpenAIEmbeddingFunction(cache=default_cache(), max_retries=max_retries)
@@ -0,0 +1,149 @@
+# 持久化的嵌入向量缓存
+# 以 (模型名, 规范化文本哈希) 为键，把向量存到本地SQLite文件中，
+# 数据导入和问答共享同一个缓存，重复文本不再调用嵌入API
+
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+DEFAULT_CACHE_PATH = "./embedding_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 200000
+
+
+def normalize_text(text):
+    """
+    规范化文本：统一Unicode形式、去掉首尾空白、合并连续空白
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split())
+
+
+def cache_key(model, text):
+    """
+    计算缓存键：模型名 + 规范化文本的SHA-256
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    基于SQLite的嵌入向量缓存，按最近使用时间(LRU)淘汰
+    Args:
+        path: SQLite文件路径
+        max_entries: 最多缓存的向量数量，超过后淘汰最久未使用的条目
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """
+        批量查询缓存
+        Args:
+            model: 嵌入模型名称
+            texts: 文本列表
+        Returns:
+            与texts等长的列表，命中的位置为向量，未命中的位置为None
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite对单条语句的参数数量有限制，分块查询
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    hit_keys = [row[0] for row in rows]
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [time.time(), *hit_keys]
+                    )
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(array.array("f", blob).tolist())
+        return results
+
+    def put_many(self, model, texts, vectors):
+        """
+        批量写入缓存，必要时淘汰最久未使用的条目
+        """
+        now = time.time()
+        rows = [
+            (cache_key(model, text), model, array.array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                # 一次多淘汰10%，避免每次写入都触发淘汰
+                evict = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (evict,)
+                )
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn.execute("COMMIT")
+
+    def stats(self):
+        """
+        返回命中统计
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._count,
+        }
+
+
+def default_cache():
+    """
+    按环境变量创建缓存，EMBEDDING_CACHE_PATH 设置为空字符串时禁用缓存
+    """
+    path = os.environ.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    max_entries = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    return EmbeddingCache(path, max_entries)
@@ -0,0 +1,216 @@
+# 并发嵌入写入流水线
+# 多个批次的嵌入请求在有界线程池中并发执行，根据限流(429)和延迟自适应调整并发数，
+# 计算好的向量交给单独的写入线程通过 collection.add(embeddings=...) 写入Chroma
+
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+
+def is_rate_limit_error(error):
+    """
+    判断异常是否为限流错误（HTTP 429）
+    """
+    if isinstance(error, openai.RateLimitError):
+        return True
+    return getattr(error, "status_code", None) == 429
+
+
+class AdaptiveLimiter:
+    """
+    自适应并发限制器（AIMD）
+    请求成功且延迟正常时缓慢增加并发上限，遇到限流或延迟突增时将并发上限减半
+    """
+
+    def __init__(self, initial, maximum, minimum=1, spike_factor=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.in_flight = 0
+        self.spike_factor = spike_factor
+        self._latency_ewma = None
+        self._credit = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def record_success(self, latency):
+        with self._cond:
+            if self._latency_ewma is not None and latency > self._latency_ewma * self.spike_factor:
+                # 延迟突增，视为上游开始拥塞
+                self._decrease()
+            else:
+                # 每完成一轮（limit 个请求）并发上限加一
+                self._credit += 1.0 / self.limit
+                if self._credit >= 1.0:
+                    self._credit = 0.0
+                    self.limit = min(self.maximum, self.limit + 1)
+            if self._latency_ewma is None:
+                self._latency_ewma = latency
+            else:
+                self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * latency
+            self._cond.notify_all()
+
+    def record_throttle(self):
+        with self._cond:
+            self._decrease()
+
+    def _decrease(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self._credit = 0.0
+
+
+class IngestStats:
+    """
+    流水线运行统计，用于进度汇报
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.batches_embedded = 0
+        self.batches_written = 0
+        self.docs_written = 0
+        self.requests = 0
+        self.tokens_embedded = 0
+        self.throttled = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self, limiter, pending_writes):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"已写入 {self.docs_written} 个文档 ({self.batches_written} 批), "
+            f"{self.docs_written / elapsed:.1f} 文档/秒, "
+            f"{self.tokens_embedded / elapsed:.0f} tokens/秒, {self.requests / elapsed:.2f} 请求/秒, "
+            f"进行中请求 {limiter.in_flight}/{limiter.limit}, "
+            f"待写入批次 {pending_writes}, 限流 {self.throttled} 次, 重试 {self.retries} 次"
+        )
+
+
+class IngestPipeline:
+    """
+    嵌入 + 写入两阶段流水线
+    Args:
+        collection: Chroma集合
+        embed_fn: 嵌入函数，接收文本列表返回向量列表
+        max_workers: 嵌入线程池大小（并发上限）
+        initial_concurrency: 初始并发数
+        max_retries: 单个批次遇到错误时的最大重试次数
+        write_queue_size: 待写入队列长度，写入跟不上时对嵌入阶段形成背压
+        report_interval: 进度汇报间隔（秒）
+        mode: 写入方式，"add" 或 "upsert"
+    """
+
+    def __init__(self, collection, embed_fn, max_workers=8, initial_concurrency=4,
+                 max_retries=5, write_queue_size=32, report_interval=2.0, mode="add"):
+        self.collection = collection
+        self.embed_fn = embed_fn
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.report_interval = report_interval
+        self.mode = mode
+        self.limiter = AdaptiveLimiter(initial_concurrency, max_workers)
+        self.stats = IngestStats()
+        self._write_queue = queue.Queue(maxsize=write_queue_size)
+        self._error = None
+        self._done = threading.Event()
+
+    def run(self, batches):
+        """
+        运行流水线直到所有批次写入完成
+        Args:
+            batches: 可迭代对象，每个元素为 (ids, documents, metadatas)，
+                或带token数的 (ids, documents, metadatas, tokens)
+        Returns:
+            运行统计 IngestStats
+        """
+        writer = threading.Thread(target=self._writer, name="chroma-writer", daemon=True)
+        reporter = threading.Thread(target=self._reporter, name="ingest-reporter", daemon=True)
+        writer.start()
+        reporter.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as executor:
+                for batch in batches:
+                    if self._error is not None:
+                        break
+                    self.limiter.acquire()
+                    executor.submit(self._embed_batch, *batch)
+        finally:
+            self._write_queue.put(None)
+            writer.join()
+            self._done.set()
+            reporter.join()
+
+        if self._error is not None:
+            raise self._error
+        print(self.stats.report(self.limiter, 0))
+        return self.stats
+
+    def _embed_batch(self, ids, documents, metadatas, tokens=0):
+        try:
+            attempt = 0
+            while self._error is None:
+                started = time.monotonic()
+                try:
+                    self.stats.add(requests=1)
+                    embeddings = self.embed_fn(documents)
+                except Exception as e:
+                    attempt += 1
+                    if is_rate_limit_error(e):
+                        self.limiter.record_throttle()
+                        self.stats.add(throttled=1)
+                    if attempt > self.max_retries:
+                        raise
+                    self.stats.add(retries=1)
+                    # 指数退避加随机抖动，避免所有线程同时重试
+                    time.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random()))
+                    continue
+                self.limiter.record_success(time.monotonic() - started)
+                self.stats.add(batches_embedded=1, tokens_embedded=tokens)
+                self._write_queue.put((ids, documents, metadatas, embeddings))
+                return
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+        finally:
+            self.limiter.release()
+
+    def _writer(self):
+        write = self.collection.upsert if self.mode == "upsert" else self.collection.add
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                # 出错后继续清空队列，避免嵌入线程阻塞在 put 上
+                continue
+            ids, documents, metadatas, embeddings = item
+            try:
+                write(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+            except Exception as e:
+                self._error = e
+                continue
+            self.stats.add(batches_written=1, docs_written=len(ids))
+
+    def _reporter(self):
+        while not self._done.wait(self.report_interval):
+            print(self.stats.report(self.limiter, self._write_queue.qsize()))
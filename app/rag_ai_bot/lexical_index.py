@@ -0,0 +1,235 @@
+# 本地倒排索引（BM25）
+# 导入数据时基于集合中的文档构建，持久化在 chroma_db 旁边，rag_chat 启动时加载一次。
+# 中文按相邻两字切分（bigram），英文和数字按单词切分，与向量检索结果做倒数排名融合(RRF)；
+# 问题中精确包含人名或电影名且词法得分明显领先时，只用倒排索引检索，不调用嵌入接口
+
+import json
+import math
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+from chroma_utils import iter_collection, matches_where
+
+DEFAULT_LEXICAL_INDEX_PATH = "./lexical_index.json"
+
+CJK_RANGES = "㐀-䶿一-鿿豈-﫿"
+TOKEN_PATTERN = re.compile(f"[{CJK_RANGES}]+|[^\\W_{CJK_RANGES}]+")
+CJK_PATTERN = re.compile(f"[{CJK_RANGES}]")
+
+# 作为实体的人名或电影名至少包含的字符数，避免 "Up"、"Her" 这类常见词误匹配
+MIN_ENTITY_CHARS = 4
+
+
+def tokenize(text):
+    """
+    分词：统一为NFKC小写后，连续的中文字符切分为相邻两字的bigram（单个汉字保留为一个词），
+    其他字母和数字按单词切分
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        word = match.group()
+        if CJK_PATTERN.match(word) and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings, limit, k=60):
+    """
+    倒数排名融合：每个文档的得分为其在各个排序结果中 1 / (k + 名次) 之和
+    Args:
+        rankings: 多个排序结果，每个为 (ids, documents)
+        limit: 返回的文档数
+        k: 平滑常数
+    Returns:
+        (ids, documents)
+    """
+    scores, documents = {}, {}
+    for ids, docs in rankings:
+        for rank, (doc_id, document) in enumerate(zip(ids, docs)):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(doc_id, document)
+    fused = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return fused, [documents[doc_id] for doc_id in fused]
+
+
+class LexicalIndex:
+    """
+    BM25倒排索引
+    Args:
+        ids: 文档ID
+        documents: 文档内容
+        metadatas: 文档元数据（用于where过滤和人名/电影名实体）
+        k1, b: BM25参数
+    """
+
+    def __init__(self, ids, documents, metadatas, k1=1.2, b=0.75):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+        self._postings = {}   # 词 -> (文档序号数组, BM25权重数组)
+        self._entities = {}   # 实体分词后以空格连接 -> 文档序号列表
+        self._max_entity_tokens = 0
+
+    @classmethod
+    def build(cls, ids, documents, metadatas, k1=1.2, b=0.75):
+        """
+        从文档构建索引
+        """
+        index = cls(ids, documents, metadatas, k1, b)
+        term_frequencies = {}
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for position, document in enumerate(documents):
+            tokens = tokenize(document or "")
+            lengths[position] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_frequencies.setdefault(token, ([], []))
+                term_frequencies[token][0].append(position)
+                term_frequencies[token][1].append(count)
+
+        # 预先计算每个倒排项的BM25权重，查询时只需按词累加
+        total = len(documents)
+        average_length = float(lengths.mean()) if total else 0.0
+        for token, (positions, counts) in term_frequencies.items():
+            positions = np.asarray(positions, dtype=np.int32)
+            counts = np.asarray(counts, dtype=np.float32)
+            idf = math.log(1 + (total - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = k1 * (1 - b + b * lengths[positions] / (average_length or 1.0))
+            index._postings[token] = (positions, idf * counts * (k1 + 1) / (counts + norm))
+
+        for position, metadata in enumerate(metadatas):
+            for field in ("name", "film"):
+                value = str((metadata or {}).get(field) or "")
+                if len(value.strip()) < MIN_ENTITY_CHARS:
+                    continue
+                key = " ".join(tokenize(value))
+                if key:
+                    index._entities.setdefault(key, []).append(position)
+        index._max_entity_tokens = max((key.count(" ") + 1 for key in index._entities), default=0)
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, page_size=1000):
+        """
+        分页读取集合中的文档构建索引
+        """
+        ids, documents, metadatas = [], [], []
+        for page in iter_collection(collection, ["documents", "metadatas"], page_size):
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+        return cls.build(ids, documents, metadatas)
+
+    def save(self, path=DEFAULT_LEXICAL_INDEX_PATH):
+        """
+        持久化索引（先写临时文件再替换，避免读到写了一半的文件）
+        """
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "documents": self.documents,
+            "metadatas": self.metadatas,
+            "postings": {token: [positions.tolist(), weights.tolist()]
+                         for token, (positions, weights) in self._postings.items()},
+            "entities": self._entities,
+        }
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_LEXICAL_INDEX_PATH):
+        """
+        加载持久化的索引
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["ids"], data["documents"], data["metadatas"], data["k1"], data["b"])
+        index._postings = {
+            token: (np.asarray(positions, dtype=np.int32), np.asarray(weights, dtype=np.float32))
+            for token, (positions, weights) in data["postings"].items()
+        }
+        index._entities = data["entities"]
+        index._max_entity_tokens = max((key.count(" ") + 1 for key in index._entities), default=0)
+        return index
+
+    def scores(self, question):
+        """
+        计算问题与每个文档的BM25得分
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(question)):
+            posting = self._postings.get(token)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    def search(self, question, n_results=10, where=None):
+        """
+        词法检索
+        Returns:
+            (ids, documents)，按BM25得分从高到低排列，只包含得分大于0的文档
+        """
+        scores = self._filter(self.scores(question), where)
+        return self._top(scores, n_results)
+
+    def entity_search(self, question, n_results=10, where=None, confidence=2.0):
+        """
+        实体快速路径：问题中精确包含人名或电影名，且包含实体的文档的最高得分
+        达到其他文档最高得分的 confidence 倍时，只返回包含实体的文档
+        Returns:
+            (ids, documents)，不满足条件时返回None
+        """
+        entity_positions = self._match_entities(tokenize(question))
+        if not entity_positions:
+            return None
+        scores = self._filter(self.scores(question), where)
+        mask = np.zeros(len(scores), dtype=bool)
+        mask[entity_positions] = True
+        entity_best = float(scores[mask].max())
+        other_best = float(scores[~mask].max()) if (~mask).any() else 0.0
+        if entity_best <= 0 or entity_best < confidence * other_best:
+            return None
+        scores[~mask] = 0
+        return self._top(scores, n_results)
+
+    def _match_entities(self, tokens):
+        # 从每个位置开始优先匹配最长的实体
+        positions = []
+        start = 0
+        while start < len(tokens):
+            for end in range(min(len(tokens), start + self._max_entity_tokens), start, -1):
+                matched = self._entities.get(" ".join(tokens[start:end]))
+                if matched:
+                    positions.extend(matched)
+                    start = end
+                    break
+            else:
+                start += 1
+        return positions
+
+    def _filter(self, scores, where):
+        if where:
+            for position, metadata in enumerate(self.metadatas):
+                if scores[position] > 0 and not matches_where(metadata or {}, where):
+                    scores[position] = 0
+        return scores
+
+    def _top(self, scores, n_results):
+        n_results = min(n_results, int(np.count_nonzero(scores > 0)))
+        if n_results <= 0:
+            return [], []
+        top = np.argpartition(-scores, n_results - 1)[:n_results]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.ids[i] for i in top], [self.documents[i] for i in top]
@@ -1,146 +1,227 @@
 # 数据加载和处理脚本
 # 用于从奥斯卡获奖数据集加载数据并存储到Chroma向量数据库
 
+import argparse
 import kagglehub
-from kagglehub import KaggleDatasetAdapter
-import pandas as pd
 import chromadb
-from chromadb import Documents, EmbeddingFunction, Embeddings
 from dotenv import load_dotenv
 import os
-import openai
+from chroma_utils import collection_names, get_search_ef, hnsw_metadata, load_metadata_field, set_search_ef
+from document_builder import iter_document_chunks, pack_by_tokens
+from embedding import create_embedding_function, max_embed_inputs
+from ingest_pipeline import IngestPipeline
+from lexical_index import DEFAULT_LEXICAL_INDEX_PATH, LexicalIndex
+from shards import DEFAULT_MANIFEST_PATH, ShardedCollection, find_shards, shard_range
 
 # 加载环境变量
 load_dotenv(dotenv_path='../../.env')
 
-# 配置OpenAI客户端
-openai.api_key = os.environ.get("QWEN_APP_KEY")
-openai.base_url = os.environ.get("QWEN_BASE_URL") + "/"
-openai.api_type = "openai"
+# 流水线配置：每个嵌入请求的最大文档数和最大token数、嵌入线程数、初始并发数
+max_inputs = max_embed_inputs()
+max_tokens = int(os.environ.get("EMBED_MAX_TOKENS", "8192"))
+embed_workers = int(os.environ.get("EMBED_WORKERS", "8"))
+embed_concurrency = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+# 只导入该年份及以后的颁奖数据，设置为0则导入全部历史数据
+min_year = int(os.environ.get("OSCAR_MIN_YEAR", "2022"))
 
-# 自定义OpenAI嵌入函数
-class OpenAIEmbeddingFunction(EmbeddingFunction):
-    def __init__(self):
-        # 初始化方法，满足Chroma未来版本的要求
-        pass
-    
-    def __call__(self, input: Documents) -> Embeddings:
-        # 调用OpenAI API生成嵌入（使用OpenAI 1.0.0+新API格式）
-        client = openai.OpenAI(
-            api_key=openai.api_key,
-            base_url=openai.base_url
-        )
-        response = client.embeddings.create(
-            model="text-embedding-v2",
-            input=input
-        )
-        # 提取嵌入向量
-        embeddings = [item.embedding for item in response.data]
-        return embeddings
+COLLECTION_NAME = "oscar_awards"
+# 倒排索引文件，保存在 chroma_db 旁边，供 rag_chat 做混合检索
+lexical_index_path = os.environ.get("RAG_LEXICAL_INDEX", DEFAULT_LEXICAL_INDEX_PATH)
+# 按颁奖年份分片：每个分片包含的年份数（例如10表示每十年一个集合），设置为0时使用单个集合
+shard_years = int(os.environ.get("OSCAR_SHARD_YEARS", "0"))
+manifest_path = os.environ.get("RAG_SHARD_MANIFEST", DEFAULT_MANIFEST_PATH)
 
 # 初始化Chroma客户端
 chroma_client = chromadb.PersistentClient(path="./chroma_db")
 
-# 删除旧集合（如果存在）
-if "oscar_awards" in [col.name for col in chroma_client.list_collections()]:
-    chroma_client.delete_collection("oscar_awards")
+# 自定义OpenAI嵌入函数（带本地嵌入缓存）
+# 限流重试由流水线统一处理，以便根据429调整并发
+embedding_function = create_embedding_function(max_retries=0)
+
+def run_pipeline(collection, batches, mode="add"):
+    """
+    分批次并发生成嵌入，由写入线程把预先计算好的向量写入Chroma
+    Args:
+        collection: Chroma集合
+        batches: 生成器，每次产出 (ids, documents, metadatas, tokens)
+        mode: 写入方式，"add" 或 "upsert"
+    """
+    pipeline = IngestPipeline(
+        collection,
+        embedding_function,
+        max_workers=embed_workers,
+        initial_concurrency=embed_concurrency,
+        mode=mode
+    )
+    return pipeline.run(batches)
+
+def open_collection():
+    """
+    打开（不存在时创建）要写入的集合，分片模式下返回按年份分片的集合
+    """
+    if shard_years > 0:
+        return ShardedCollection(chroma_client, COLLECTION_NAME, shard_years, embedding_function,
+                                 create_metadata=hnsw_metadata())
+    # HNSW参数只在创建集合时生效
+    return chroma_client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata=hnsw_metadata(),
+        embedding_function=embedding_function
+    )
 
-# 创建新集合，使用自定义OpenAI嵌入函数
-collection = chroma_client.create_collection(
-    name="oscar_awards",
-    embedding_function=OpenAIEmbeddingFunction()
-)
+def apply_search_ef(collection):
+    """
+    把 CHROMA_HNSW_SEARCH_EF 写入已有集合（或所有分片）的配置，无需重建；新建的集合在创建时已经使用该值
+    search_ef 只在导入时修改一次，查询进程在加载索引时读取（导入后重启 rag_chat 的进程生效）
+    """
+    value = os.environ.get("CHROMA_HNSW_SEARCH_EF")
+    if not value:
+        return
+    shards = collection.shards.values() if isinstance(collection, ShardedCollection) else [collection]
+    for shard in shards:
+        if get_search_ef(shard) != int(value):
+            set_search_ef(shard, int(value))
 
-def load_and_process_data():
+def rebuild_collection(batches, shard_year=None):
+    """
+    删除旧集合并全量重建
+    Args:
+        batches: 生成器，每次产出 (ids, documents, metadatas)
+        shard_year: 分片模式下只重建该年份所在的分片，其他分片保持不变
+    """
+    if shard_years > 0:
+        collection = open_collection()
+        if shard_year is None:
+            collection.drop_all()
+        else:
+            collection.drop_shard(shard_year)
+            start, end = shard_range(shard_year, shard_years)
+            batches = filter_years(batches, start, end)
+        run_pipeline(collection, pack_by_tokens(batches, max_inputs, max_tokens))
+        return collection
+
+    # 删除旧集合（如果存在）
+    if COLLECTION_NAME in collection_names(chroma_client):
+        chroma_client.delete_collection(COLLECTION_NAME)
+
+    # 创建新集合，使用自定义OpenAI嵌入函数和配置的HNSW参数
+    collection = chroma_client.create_collection(
+        name=COLLECTION_NAME,
+        metadata=hnsw_metadata(),
+        embedding_function=embedding_function
+    )
+    run_pipeline(collection, pack_by_tokens(batches, max_inputs, max_tokens))
+    return collection
+
+def drop_stale_layout():
+    """
+    删除另一种布局留下的集合，避免之后读到过期数据：分片模式下删除单个集合和跨度不同的旧分片，
+    单集合模式下删除所有分片。在新布局写入完成后调用，切换过程中旧布局仍然可以查询
+    """
+    shards = find_shards(chroma_client, COLLECTION_NAME)
+    if shard_years > 0:
+        stale = [name for (start, end), name in shards.items() if end - start + 1 != shard_years]
+        if COLLECTION_NAME in collection_names(chroma_client):
+            stale.append(COLLECTION_NAME)
+    else:
+        stale = list(shards.values())
+    for name in stale:
+        chroma_client.delete_collection(name)
+        print(f"已删除另一种布局的集合 {name}")
+
+def filter_years(batches, start, end):
+    """
+    只保留颁奖年份在 [start, end] 范围内的文档
+    """
+    for ids, documents, metadatas in batches:
+        keep = [i for i, metadata in enumerate(metadatas) if start <= metadata["year_ceremony"] <= end]
+        yield [ids[i] for i in keep], [documents[i] for i in keep], [metadatas[i] for i in keep]
+
+def sync_collection(batches):
+    """
+    增量同步：对比集合中已有的内容哈希，只 upsert 新增或变化的行，删除数据集中已不存在的行
+    同步过程中集合始终可以查询
+    """
+    collection = open_collection()
+    existing_hashes = load_metadata_field(collection, "content_hash")
+    print(f"集合中已有 {len(existing_hashes)} 个文档")
+
+    seen_ids = set()
+
+    def changed_rows():
+        for ids, documents, metadatas in batches:
+            seen_ids.update(ids)
+            changed = [i for i, (doc_id, metadata) in enumerate(zip(ids, metadatas))
+                       if existing_hashes.get(doc_id) != metadata["content_hash"]]
+            yield ([ids[i] for i in changed],
+                   [documents[i] for i in changed],
+                   [metadatas[i] for i in changed])
+
+    stats = run_pipeline(collection, pack_by_tokens(changed_rows(), max_inputs, max_tokens), mode="upsert")
+    stale_ids = list(existing_hashes.keys() - seen_ids)
+    for i in range(0, len(stale_ids), 1000):
+        collection.delete(ids=stale_ids[i:i + 1000])
+    print(f"数据集共 {len(seen_ids)} 个文档，更新 {stats.docs_written} 个，删除 {len(stale_ids)} 个")
+    return collection
+
+def load_and_process_data(rebuild=False, shard_year=None):
     """
     加载奥斯卡获奖数据集并处理存储到Chroma向量数据库
+    Args:
+        rebuild: 为True时删除旧集合全量重建，否则增量同步
+        shard_year: 分片模式下全量重建时只重建该年份所在的分片
     """
     print("开始加载奥斯卡获奖数据集...")
     
     try:
-        # 从Kaggle加载数据集
-        df = kagglehub.load_dataset(
-            KaggleDatasetAdapter.PANDAS,
-            "unanimad/the-oscar-award",
-            "the_oscar_award.csv",
-        )
-        
-        print(f"数据集加载成功，共 {len(df)} 条记录")
-        print("数据集前5行:")
-        print(df.head())
-        
-        # 数据预处理
-        print("开始数据预处理...")
-        
-        # 选择相关列
-        relevant_columns = ['year_ceremony', 'category', 'name', 'film', 'winner']
-        df = df[relevant_columns]
-        
-        # 只保留2022年及以后的数据
-        df = df[df['year_ceremony'] >= 2022]
-        
-        # 过滤掉空的film条目
-        df = df[df['film'].notna() & (df['film'] != '')]
-        
-        # 过滤掉其他缺失值
-        df = df.dropna()
-        
-        # 构建文档列表
-        documents = []
-        ids = []
-        metadatas = []
-        
-        for idx, row in df.iterrows():
-            # 构建文档内容
-            doc_content = f"颁奖年份: {row['year_ceremony']}\n"
-            doc_content += f"奖项类别: {row['category']}\n"
-            doc_content += f"获奖者: {row['name']}\n"
-            doc_content += f"电影名称: {row['film']}\n"
-            doc_content += f"是否获奖: {'是' if row['winner'] else '否'}\n"
-            
-            documents.append(doc_content)
-            ids.append(f"oscar_{idx}")
-            
-            # 构建元数据
-            metadata = {
-                'year_ceremony': row['year_ceremony'],
-                'category': row['category'],
-                'name': row['name'],
-                'film': row['film'],
-                'winner': row['winner']
-            }
-            metadatas.append(metadata)
-        
-        print(f"数据预处理完成，共生成 {len(documents)} 个文档")
+        # 从Kaggle下载数据集，分块读取CSV并流式构建文档（按token数打包为嵌入请求）
+        dataset_path = kagglehub.dataset_download("unanimad/the-oscar-award")
+        csv_path = os.path.join(dataset_path, "the_oscar_award.csv")
+        print(f"数据集下载成功: {csv_path}")
+        batches = iter_document_chunks(csv_path, min_year=min_year)
         
         # 将数据存储到Chroma
         print("开始将数据存储到Chroma向量数据库...")
         
-        # 分批次插入数据，避免API限制（OpenAI API批次大小限制为10）
-        batch_size = 10
-        for i in range(0, len(documents), batch_size):
-            end_idx = min(i + batch_size, len(documents))
-            batch_docs = documents[i:end_idx]
-            batch_ids = ids[i:end_idx]
-            batch_metadatas = metadatas[i:end_idx]
-            
-            collection.add(
-                documents=batch_docs,
-                ids=batch_ids,
-                metadatas=batch_metadatas
-            )
-            
-            print(f"已插入批次 {i//batch_size + 1}/{(len(documents)+batch_size-1)//batch_size}")
+        if rebuild:
+            collection = rebuild_collection(batches, shard_year)
+        else:
+            collection = sync_collection(batches)
         
+        apply_search_ef(collection)
         print("数据存储完成！")
         
+        # 分片模式下记录分片清单，rag_chat 根据清单按年份路由查询；单集合模式下删除过期的清单
+        if shard_years > 0:
+            collection.save_manifest(manifest_path)
+            print(f"分片清单已保存到 {manifest_path}")
+        elif os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        drop_stale_layout()
+        
         # 验证数据
         collection_stats = collection.count()
         print(f"Chroma集合中共有 {collection_stats} 个文档")
+        if embedding_function.cache is not None:
+            print(f"嵌入缓存统计: {embedding_function.cache.stats()}")
+        
+        # 根据同步后的集合重建倒排索引
+        LexicalIndex.from_collection(collection).save(lexical_index_path)
+        print(f"倒排索引已保存到 {lexical_index_path}")
         
     except Exception as e:
         print(f"数据加载和处理失败: {e}")
         raise
 
 if __name__ == "__main__":
-    load_and_process_data()
\ No newline at end of file
+    # 默认增量同步，传入 --rebuild 删除旧集合全量重建
+    # 分片模式下可以用 --rebuild --shard 年份 只重建该年份所在的分片
+    parser = argparse.ArgumentParser(description="导入奥斯卡获奖数据集到Chroma")
+    parser.add_argument("--rebuild", action="store_true", help="删除旧集合全量重建（默认增量同步）")
+    parser.add_argument("--shard", type=int, metavar="年份", help="分片模式下只重建该年份所在的分片（需要 --rebuild）")
+    args = parser.parse_args()
+    if args.shard is not None and not args.rebuild:
+        parser.error("--shard 需要和 --rebuild 一起使用")
+    if args.shard is not None and shard_years <= 0:
+        parser.error("--shard 只能在分片模式下使用（设置 OSCAR_SHARD_YEARS）")
+    load_and_process_data(rebuild=args.rebuild, shard_year=args.shard)
@@ -0,0 +1,216 @@
+# 本地向量索引（可选的检索后端）
+# 从 oscar_awards 集合导出向量，保存为内存映射的NumPy文件，支持 float16/int8 量化：
+# 先用量化向量做分块的暴力搜索得到候选，再用原始float32向量精确重排。
+# 打开索引只需毫秒级，多个worker进程可以共享操作系统页缓存中的同一份索引
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from chroma_utils import iter_collection, matches_where
+
+DEFAULT_INDEX_PATH = "./local_index"
+QUANTIZATIONS = ("int8", "float16", "none")
+
+
+def _quantize(vectors, quantization):
+    """
+    量化一批向量
+    Returns:
+        (codes, scales)，int8量化时scales为每个向量的缩放系数，其他情况为None
+    """
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    return vectors, None
+
+
+def export_collection(collection, path=DEFAULT_INDEX_PATH, quantization="int8", page_size=1000):
+    """
+    把Chroma集合导出为本地向量索引
+    Args:
+        collection: Chroma集合
+        path: 索引目录
+        quantization: 量化方式，"int8"、"float16" 或 "none"
+        page_size: 每次从集合读取的记录数
+    Returns:
+        导出的向量数量
+    Raises:
+        ValueError: 集合为空时（不写入任何文件，已有的索引保持不变）
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"不支持的量化方式: {quantization}")
+    count = collection.count()
+    if count == 0:
+        raise ValueError(f"集合 {collection.name} 为空，请先运行 load_data.py 导入数据")
+    os.makedirs(path, exist_ok=True)
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+
+    ids, documents, metadatas = [], [], []
+    vectors = codes = scales = norms = None
+    written = 0
+    for page in iter_collection(collection, ["embeddings", "documents", "metadatas"], page_size):
+        batch = np.asarray(page["embeddings"], dtype=np.float32)
+        if vectors is None:
+            dim = batch.shape[1]
+            code_dtype = {"int8": np.int8, "float16": np.float16, "none": np.float32}[quantization]
+            vectors = np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), "w+", np.float32, (count, dim))
+            codes = np.lib.format.open_memmap(os.path.join(path, "codes.npy"), "w+", code_dtype, (count, dim))
+            norms = np.lib.format.open_memmap(os.path.join(path, "norms.npy"), "w+", np.float32, (count,))
+            if quantization == "int8":
+                scales = np.lib.format.open_memmap(os.path.join(path, "scales.npy"), "w+", np.float32, (count,))
+        # 导出过程中集合有新增时，只保留开始导出时的数量
+        batch = batch[:count - written]
+        end = written + len(batch)
+        batch_codes, batch_scales = _quantize(batch, quantization)
+        vectors[written:end] = batch
+        codes[written:end] = batch_codes
+        norms[written:end] = np.einsum("ij,ij->i", batch, batch)
+        if scales is not None:
+            scales[written:end] = batch_scales
+        ids.extend(page["ids"][:len(batch)])
+        documents.extend(page["documents"][:len(batch)])
+        metadatas.extend(page["metadatas"][:len(batch)])
+        written = end
+        if written >= count:
+            break
+    if written == 0:
+        # 导出过程中集合被清空，没有创建向量文件，不写入 index.json
+        raise ValueError(f"集合 {collection.name} 为空，请先运行 load_data.py 导入数据")
+
+    for array in (vectors, codes, norms, scales):
+        if array is not None:
+            array.flush()
+    with open(os.path.join(path, "records.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f, ensure_ascii=False)
+    with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": written, "quantization": quantization, "space": space}, f)
+    return written
+
+
+class LocalVectorIndex:
+    """
+    内存映射的本地向量索引，query() 的参数和返回格式与Chroma集合一致
+    Args:
+        path: 索引目录
+        rescore_factor: 候选数量为 n_results 的倍数，候选用原始向量精确重排
+        block_size: 分块搜索时每块的向量数
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, rescore_factor=4, block_size=8192):
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+            info = json.load(f)
+        self.size = info["count"]
+        self.quantization = info["quantization"]
+        self.space = info["space"]
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")[:self.size]
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")[:self.size]
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")[:self.size]
+        self.scales = None
+        if self.quantization == "int8":
+            self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")[:self.size]
+        with open(os.path.join(path, "records.json"), encoding="utf-8") as f:
+            records = json.load(f)
+        self.ids = records["ids"]
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+
+    def count(self):
+        """
+        返回索引中的向量数量（与 collection.count 一致）
+        """
+        return self.size
+
+    def get(self, include=("documents", "metadatas"), limit=None, offset=0):
+        """
+        分页读取索引中的记录，返回与 collection.get 相同结构的结果（可配合 iter_collection 使用）
+        """
+        end = self.size if limit is None else min(offset + limit, self.size)
+        results = {"ids": self.ids[offset:end]}
+        for field in ("documents", "metadatas"):
+            results[field] = getattr(self, field)[offset:end] if field in include else None
+        results["embeddings"] = np.asarray(self.vectors[offset:end]) if "embeddings" in include else None
+        return results
+
+    def query(self, query_embeddings, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")):
+        """
+        向量检索，返回与 collection.query 相同结构的结果
+        """
+        mask = None
+        if where:
+            mask = np.fromiter((matches_where(metadata or {}, where) for metadata in self.metadatas),
+                               dtype=bool, count=self.size)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in query_embeddings:
+            indices, distances = self._search(np.asarray(query, dtype=np.float32), n_results, mask)
+            results["ids"].append([self.ids[i] for i in indices])
+            results["documents"].append([self.documents[i] for i in indices] if "documents" in include else None)
+            results["metadatas"].append([self.metadatas[i] for i in indices] if "metadatas" in include else None)
+            results["distances"].append(distances.tolist() if "distances" in include else None)
+        for field in ("documents", "metadatas", "distances"):
+            if field not in include:
+                results[field] = None
+        return results
+
+    def _search(self, query, n_results, mask):
+        query_norm = float(np.dot(query, query))
+        # 1. 用量化向量分块计算近似距离
+        approx = np.empty(self.size, dtype=np.float32)
+        for start in range(0, self.size, self.block_size):
+            end = min(start + self.block_size, self.size)
+            dots = np.asarray(self.codes[start:end], dtype=np.float32) @ query
+            if self.scales is not None:
+                dots *= self.scales[start:end]
+            approx[start:end] = self._distance(dots, self.norms[start:end], query_norm)
+        if mask is not None:
+            approx[~mask] = np.inf
+        available = self.size if mask is None else int(mask.sum())
+        n_results = min(n_results, available)
+        if n_results <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        # 2. 取若干倍的候选，用原始float32向量精确重排
+        n_candidates = min(n_results * self.rescore_factor, available)
+        candidates = np.argpartition(approx, n_candidates - 1)[:n_candidates]
+        candidates.sort()
+        exact_dots = np.asarray(self.vectors[candidates]) @ query
+        exact = self._distance(exact_dots, self.norms[candidates], query_norm)
+        order = np.argsort(exact)[:n_results]
+        return candidates[order], exact[order]
+
+    def _distance(self, dots, norms, query_norm):
+        if self.space == "cosine":
+            denominator = np.sqrt(norms) * np.sqrt(query_norm)
+            denominator[denominator == 0] = 1.0
+            return 1.0 - dots / denominator
+        if self.space == "ip":
+            return 1.0 - dots
+        # 默认l2：平方欧氏距离，与Chroma一致
+        return norms + query_norm - 2.0 * dots
+
+
+if __name__ == "__main__":
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="把 oscar_awards 集合导出为本地向量索引")
+    parser.add_argument("path", nargs="?", default=DEFAULT_INDEX_PATH, help="索引目录")
+    parser.add_argument("--collection", default="oscar_awards", help="集合名称")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default="int8", help="量化方式")
+    args = parser.parse_args()
+
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    source = chroma_client.get_collection(name=args.collection)
+    try:
+        exported = export_collection(source, args.path, args.quantization)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"已导出 {exported} 个向量到 {args.path}（量化方式: {args.quantization}）")
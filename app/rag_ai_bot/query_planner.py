@@ -0,0 +1,302 @@
+# 查询规划器
+# 用集合元数据（year_ceremony、ceremony、category、name、film、winner）预先构建查找索引，
+# 从问题中识别颁奖年份、届次、奖项类别和“获奖/提名”意图：
+# 生成Chroma的where过滤条件缩小检索范围；对“某年某奖项的得主是谁”这类纯事实查询，
+# 直接从内存索引回答，不调用嵌入和LLM
+
+import re
+
+from chroma_utils import iter_collection
+
+# 常见的中英文奖项叫法 -> 数据集中可能的类别名称（不同年代的类别名称不同，只保留数据中存在的）
+CATEGORY_ALIASES = {
+    "最佳影片": ["BEST PICTURE", "OUTSTANDING PICTURE", "OUTSTANDING PRODUCTION", "OUTSTANDING MOTION PICTURE", "BEST MOTION PICTURE"],
+    "best picture": ["BEST PICTURE", "OUTSTANDING PICTURE", "OUTSTANDING PRODUCTION", "OUTSTANDING MOTION PICTURE", "BEST MOTION PICTURE"],
+    "最佳导演": ["DIRECTING", "DIRECTING (Dramatic Picture)", "DIRECTING (Comedy Picture)"],
+    "best director": ["DIRECTING", "DIRECTING (Dramatic Picture)", "DIRECTING (Comedy Picture)"],
+    "最佳男主角": ["ACTOR IN A LEADING ROLE", "ACTOR"],
+    "best actor": ["ACTOR IN A LEADING ROLE", "ACTOR"],
+    "最佳女主角": ["ACTRESS IN A LEADING ROLE", "ACTRESS"],
+    "best actress": ["ACTRESS IN A LEADING ROLE", "ACTRESS"],
+    "最佳男配角": ["ACTOR IN A SUPPORTING ROLE"],
+    "best supporting actor": ["ACTOR IN A SUPPORTING ROLE"],
+    "最佳女配角": ["ACTRESS IN A SUPPORTING ROLE"],
+    "best supporting actress": ["ACTRESS IN A SUPPORTING ROLE"],
+    "最佳动画长片": ["ANIMATED FEATURE FILM"],
+    "best animated feature": ["ANIMATED FEATURE FILM"],
+    "最佳国际影片": ["INTERNATIONAL FEATURE FILM", "FOREIGN LANGUAGE FILM"],
+    "最佳外语片": ["INTERNATIONAL FEATURE FILM", "FOREIGN LANGUAGE FILM"],
+    "best international feature": ["INTERNATIONAL FEATURE FILM", "FOREIGN LANGUAGE FILM"],
+    "best foreign language film": ["INTERNATIONAL FEATURE FILM", "FOREIGN LANGUAGE FILM"],
+    "最佳原创剧本": ["WRITING (Original Screenplay)"],
+    "best original screenplay": ["WRITING (Original Screenplay)"],
+    "最佳改编剧本": ["WRITING (Adapted Screenplay)"],
+    "best adapted screenplay": ["WRITING (Adapted Screenplay)"],
+    "最佳摄影": ["CINEMATOGRAPHY"],
+    "best cinematography": ["CINEMATOGRAPHY"],
+    "最佳剪辑": ["FILM EDITING"],
+    "best film editing": ["FILM EDITING"],
+    "最佳原创配乐": ["MUSIC (Original Score)"],
+    "best original score": ["MUSIC (Original Score)"],
+    "最佳原创歌曲": ["MUSIC (Original Song)"],
+    "best original song": ["MUSIC (Original Song)"],
+    "最佳视觉效果": ["VISUAL EFFECTS"],
+    "best visual effects": ["VISUAL EFFECTS"],
+    "最佳服装设计": ["COSTUME DESIGN"],
+    "best costume design": ["COSTUME DESIGN"],
+    "最佳化妆与发型设计": ["MAKEUP AND HAIRSTYLING", "MAKEUP"],
+    "最佳化妆": ["MAKEUP AND HAIRSTYLING", "MAKEUP"],
+    "best makeup and hairstyling": ["MAKEUP AND HAIRSTYLING", "MAKEUP"],
+    "最佳艺术指导": ["PRODUCTION DESIGN", "ART DIRECTION"],
+    "最佳美术设计": ["PRODUCTION DESIGN", "ART DIRECTION"],
+    "best production design": ["PRODUCTION DESIGN", "ART DIRECTION"],
+    "最佳音效": ["SOUND", "SOUND MIXING", "SOUND EDITING"],
+    "best sound": ["SOUND", "SOUND MIXING", "SOUND EDITING"],
+    "最佳纪录长片": ["DOCUMENTARY FEATURE FILM", "DOCUMENTARY (Feature)"],
+    "best documentary feature": ["DOCUMENTARY FEATURE FILM", "DOCUMENTARY (Feature)"],
+    "最佳纪录短片": ["DOCUMENTARY SHORT FILM", "DOCUMENTARY (Short Subject)"],
+    "best documentary short": ["DOCUMENTARY SHORT FILM", "DOCUMENTARY (Short Subject)"],
+    "最佳动画短片": ["SHORT FILM (Animated)"],
+    "best animated short": ["SHORT FILM (Animated)"],
+    "最佳真人短片": ["SHORT FILM (Live Action)"],
+    "best live action short": ["SHORT FILM (Live Action)"],
+}
+
+NOMINEE_WORDS = ("提名", "入围", "候选", "nominee", "nominated", "nomination")
+WINNER_WORDS = ("获奖", "获得", "得主", "赢得", "夺得", "摘得", "得奖", "won", "win", "winner")
+# 出现这些词时问题需要解释或推理，不走直接回答的快速路径
+OPEN_ENDED_WORDS = ("为什么", "如何", "怎么", "介绍", "评价", "比较", "几次", "多少", "哪些年",
+                    "why", "how", "explain", "compare", "describe")
+# 查询人物或作品的疑问词，带年份和奖项时默认询问获奖者
+QUESTION_WORDS = ("谁", "哪", "什么", "who", "which", "what")
+
+CHINESE_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+YEAR_PATTERN = re.compile(r"(?<!\d)(19[2-9]\d|20\d\d)(?!\d)")
+CEREMONY_PATTERN = re.compile(r"第\s*(\d{1,3}|[零一二两三四五六七八九十百]+)\s*届")
+ENGLISH_CEREMONY_PATTERN = re.compile(r"(?<!\d)(\d{1,3})(?:st|nd|rd|th)\s+(?:academy awards?|oscars?|ceremony)", re.IGNORECASE)
+
+
+def term_pattern(term):
+    """
+    英文词语按完整单词匹配（"how" 不匹配 "show"，"sound" 不匹配 "soundtrack"），中文词语按子串匹配
+    """
+    if term.isascii():
+        return re.compile(rf"(?<![a-z0-9]){re.escape(term)}(?![a-z0-9])")
+    return re.compile(re.escape(term))
+
+
+def words_pattern(words):
+    return re.compile("|".join(term_pattern(word).pattern for word in words))
+
+
+NOMINEE_PATTERN = words_pattern(NOMINEE_WORDS)
+WINNER_PATTERN = words_pattern(WINNER_WORDS)
+OPEN_ENDED_PATTERN = words_pattern(OPEN_ENDED_WORDS)
+QUESTION_PATTERN = words_pattern(QUESTION_WORDS)
+
+
+def parse_chinese_number(text):
+    """
+    解析不超过999的中文数字，例如 "九十五"、"一百零二"
+    """
+    if text.isdigit():
+        return int(text)
+    total, current = 0, 0
+    for char in text:
+        if char == "百":
+            total += (current or 1) * 100
+            current = 0
+        elif char == "十":
+            total += (current or 1) * 10
+            current = 0
+        else:
+            current = CHINESE_DIGITS[char]
+    return total + current
+
+
+class QueryPlan:
+    """
+    查询规划结果
+    Args:
+        years: 识别出的颁奖年份列表（包括识别出的届次所在的年份）
+        ceremonies: 识别出的届次列表
+        categories: 识别出的类别名称列表（数据集中的原始名称）
+        label: 奖项的中文名称，用于生成回答
+        winner: True 表示只关心获奖者（询问得主是谁），None 表示获奖和提名都需要
+        lookup: 是否为可以直接从索引回答的事实查询
+    """
+
+    def __init__(self, years, ceremonies, categories, label, winner, lookup):
+        self.years = years
+        self.ceremonies = ceremonies
+        self.categories = categories
+        self.label = label
+        self.winner = winner
+        self.lookup = lookup
+
+    def where(self):
+        """
+        生成Chroma的where过滤条件，没有识别出任何条件时返回None
+        """
+        conditions = []
+        if self.years:
+            conditions.append({"year_ceremony": self.years[0] if len(self.years) == 1 else {"$in": self.years}})
+        if self.ceremonies:
+            # 早期同一年有两届（例如1930年的第2、3届），届次不能由年份推算，按元数据中的届次过滤
+            conditions.append({"ceremony": self.ceremonies[0] if len(self.ceremonies) == 1 else {"$in": self.ceremonies}})
+        if self.categories:
+            conditions.append({"category": self.categories[0] if len(self.categories) == 1 else {"$in": self.categories}})
+        if self.winner:
+            conditions.append({"winner": True})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class QueryPlanner:
+    """
+    基于集合元数据的查询规划器
+    Args:
+        metadatas: 集合中全部记录的元数据
+    """
+
+    def __init__(self, metadatas):
+        self.years = set()
+        self.categories = set()
+        self._rows = {}  # (届次, 类别) -> [(获奖者, 电影名称, 是否获奖)]
+        self._ceremony_years = {}  # 届次 -> 颁奖年份
+        self._year_ceremonies = {}  # 颁奖年份 -> 该年举行的届次
+        for metadata in metadatas:
+            if not metadata:
+                continue
+            year, category = metadata.get("year_ceremony"), metadata.get("category")
+            if year is None or category is None:
+                continue
+            self.years.add(year)
+            self.categories.add(category)
+            ceremony = metadata.get("ceremony")
+            if ceremony is None:
+                # 旧版本导入的记录没有届次，重新运行 load_data.py 同步后补上
+                continue
+            self._ceremony_years[ceremony] = year
+            self._year_ceremonies.setdefault(year, set()).add(ceremony)
+            self._rows.setdefault((ceremony, category), []).append(
+                (metadata.get("name"), metadata.get("film"), bool(metadata.get("winner")))
+            )
+
+        # 别名只保留数据集中存在的类别，数据集中的原始类别名称本身也作为别名
+        self._aliases = {}
+        for alias, names in CATEGORY_ALIASES.items():
+            present = [name for name in names if name in self.categories]
+            if present:
+                self._aliases[alias] = present
+        for category in self.categories:
+            self._aliases.setdefault(category.lower(), [category])
+        # 按长度从长到短匹配，"best supporting actor" 优先于 "best actor"
+        self._alias_order = sorted(self._aliases, key=len, reverse=True)
+        self._alias_patterns = {alias: term_pattern(alias) for alias in self._aliases}
+        # 类别名称 -> 中文奖项名称，英文问法和原始类别名称在回答中也使用中文名称
+        self._labels = {}
+        for alias, names in CATEGORY_ALIASES.items():
+            if not alias.isascii():
+                for name in names:
+                    self._labels.setdefault(name, alias)
+
+    @classmethod
+    def from_collection(cls, collection, page_size=1000):
+        """
+        分页读取集合的元数据构建查询规划器
+        """
+        metadatas = []
+        for page in iter_collection(collection, ["metadatas"], page_size):
+            metadatas.extend(page["metadatas"])
+        return cls(metadatas)
+
+    def plan(self, question):
+        """
+        分析问题，识别年份、类别和获奖意图
+        Returns:
+            QueryPlan
+        """
+        text = question.lower()
+        years, ceremonies = self._extract_years(question)
+        label, categories = self._extract_categories(text)
+
+        nominee = bool(NOMINEE_PATTERN.search(text))
+        won = bool(WINNER_PATTERN.search(text))
+        asks_who = bool(QUESTION_PATTERN.search(text))
+        open_ended = bool(OPEN_ENDED_PATTERN.search(text))
+        # 只能确定一届时才直接回答（年份对应两届时交给RAG）
+        lookup = (len(self._target_ceremonies(years, ceremonies)) == 1 and bool(categories)
+                  and (nominee or won or asks_who) and not open_ended)
+        # 只有询问得主是谁时才只看获奖者；"X获奖了吗/was X nominated" 需要保留提名记录
+        winner = True if asks_who and not nominee and (won or lookup) else None
+        return QueryPlan(years, ceremonies, categories, label, winner, lookup)
+
+    def answer(self, plan):
+        """
+        直接从元数据索引回答事实查询
+        Returns:
+            回答文本，不能直接回答时返回None
+        """
+        if not plan.lookup:
+            return None
+        ceremony = self._target_ceremonies(plan.years, plan.ceremonies)[0]
+        rows = []
+        for category in plan.categories:
+            rows.extend(self._rows.get((ceremony, category), []))
+        if plan.winner:
+            rows = [row for row in rows if row[2]]
+        if not rows:
+            return None
+
+        title = f"第{ceremony}届（{self._ceremony_years[ceremony]}年）奥斯卡{plan.label}"
+        if plan.winner:
+            winners = "、".join(f"{name}（《{film}》）" for name, film, _ in rows)
+            return f"{title}的获奖者是：{winners}。"
+        lines = [f"- {name}（《{film}》）{'【获奖】' if won else ''}" for name, film, won in rows]
+        return f"{title}的提名名单：\n" + "\n".join(lines)
+
+    def _extract_years(self, question):
+        """
+        Returns:
+            (颁奖年份列表, 届次列表)，届次所在的年份也加入年份列表，以便分片集合按年份路由
+        """
+        ceremonies = []
+        for match in CEREMONY_PATTERN.finditer(question):
+            ceremonies.append(parse_chinese_number(match.group(1)))
+        for match in ENGLISH_CEREMONY_PATTERN.finditer(question):
+            ceremonies.append(int(match.group(1)))
+        # 去重并只保留数据中存在的届次和年份
+        ceremonies = [ceremony for ceremony in dict.fromkeys(ceremonies) if ceremony in self._ceremony_years]
+        years = [self._ceremony_years[ceremony] for ceremony in ceremonies]
+        for match in YEAR_PATTERN.finditer(question):
+            years.append(int(match.group(1)))
+        years = [year for year in dict.fromkeys(years) if year in self.years]
+        return years, ceremonies
+
+    def _target_ceremonies(self, years, ceremonies):
+        """
+        问题涉及的届次：指定了届次时使用届次，否则为指定年份举行的所有届次
+        """
+        if ceremonies:
+            return ceremonies
+        return sorted(ceremony for year in years for ceremony in self._year_ceremonies.get(year, ()))
+
+    def _extract_categories(self, text):
+        label, categories = None, []
+        for alias in self._alias_order:
+            match = self._alias_patterns[alias].search(text)
+            if match is None:
+                continue
+            if label is None:
+                # 中文问法保留原来的叫法，英文问法和原始类别名称换成对应的中文名称
+                first = self._aliases[alias][0]
+                label = alias if not alias.isascii() else self._labels.get(first, first.title())
+            for category in self._aliases[alias]:
+                if category not in categories:
+                    categories.append(category)
+            # 已匹配的部分不再参与更短别名的匹配
+            text = text[:match.start()] + "\0" * len(alias) + text[match.end():]
+        return label, categories
@@ -1,48 +1,204 @@
 from dotenv import load_dotenv
 import os
-import openai
 import sys
 import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
-from chromadb import Documents, EmbeddingFunction, Embeddings
+from answer_cache import context_fingerprint, create_answer_cache
+from context_packer import pack_context
+from embedding import create_embedding_function, max_embed_inputs
+from lexical_index import DEFAULT_LEXICAL_INDEX_PATH, LexicalIndex, reciprocal_rank_fusion
+from local_index import DEFAULT_INDEX_PATH, LocalVectorIndex
+from query_planner import QueryPlanner
+from shards import DEFAULT_MANIFEST_PATH, ShardedCollection, load_manifest
+
+from common.llm_clients import get_client
 
 # 加载环境变量
 load_dotenv(dotenv_path='../../.env')
 
-# 配置OpenAI客户端
-openai.api_key = os.environ.get("QWEN_APP_KEY")
-openai.base_url = os.environ.get("QWEN_BASE_URL") + "/"
-openai.api_type = "openai"
+# 聊天模型，客户端通过共享的客户端工厂获取
 deployment_name = os.environ.get("CHAT_MODEL")
 
-# 自定义OpenAI嵌入函数
-class OpenAIEmbeddingFunction(EmbeddingFunction):
-    def __init__(self):
-        # 初始化方法，满足Chroma未来版本的要求
-        pass
-    
-    def __call__(self, input: Documents) -> Embeddings:
-        # 调用OpenAI API生成嵌入（使用OpenAI 1.0.0+新API格式）
-        client = openai.OpenAI(
-            api_key=openai.api_key,
-            base_url=openai.base_url
-        )
-        response = client.embeddings.create(
-            model="text-embedding-v2",
-            input=input
+# 检索候选文档数，以及上下文允许使用的最大token数
+n_candidates = int(os.environ.get("RAG_CANDIDATES", "20"))
+context_token_budget = int(os.environ.get("RAG_CONTEXT_TOKENS", "1000"))
+
+# 获取集合，使用自定义OpenAI嵌入函数（带本地嵌入缓存）
+embedding_function = create_embedding_function()
+
+# 检索后端：默认使用Chroma集合；RAG_BACKEND=local 时使用内存映射的本地向量索引
+# （需先运行 python local_index.py 从集合导出）；load_data.py 以分片模式导入后按分片清单
+# 使用按年份分片的集合。几种后端的 query() 接口一致
+shard_manifest = load_manifest(os.environ.get("RAG_SHARD_MANIFEST", DEFAULT_MANIFEST_PATH))
+if os.environ.get("RAG_BACKEND", "chroma") == "local":
+    collection = LocalVectorIndex(os.environ.get("RAG_LOCAL_INDEX", DEFAULT_INDEX_PATH))
+elif shard_manifest is not None:
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    collection = ShardedCollection(
+        chroma_client,
+        shard_manifest["base"],
+        shard_manifest["span"],
+        embedding_function=embedding_function
+    )
+else:
+    # 初始化Chroma客户端和集合
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    collection = chroma_client.get_collection(
+        name="oscar_awards",
+        embedding_function=embedding_function
+    )
+
+# 语义回答缓存，常驻服务模式下相似问题直接返回缓存的回答
+answer_cache = create_answer_cache()
+
+# 查询规划器：启动时用集合元数据构建查找索引，识别问题中的年份、奖项和获奖意图，
+# 生成where过滤条件；RAG_FAST_PATH 开启时事实查询直接从索引回答，不调用嵌入和LLM
+query_planner = QueryPlanner.from_collection(collection) if os.environ.get("RAG_QUERY_PLANNER", "1") == "1" else None
+fast_path_enabled = os.environ.get("RAG_FAST_PATH", "1") == "1"
+
+# 倒排索引（由 load_data.py 生成）：存在时与向量检索结果融合，实体查询只用倒排索引检索
+lexical_index_path = os.environ.get("RAG_LEXICAL_INDEX", DEFAULT_LEXICAL_INDEX_PATH)
+lexical_index = None
+if os.environ.get("RAG_HYBRID", "1") == "1" and os.path.exists(lexical_index_path):
+    lexical_index = LexicalIndex.load(lexical_index_path)
+lexical_confidence = float(os.environ.get("RAG_LEXICAL_CONFIDENCE", "2.0"))
+
+def plan_question(question):
+    """
+    用查询规划器分析问题
+    Returns:
+        (where, answer)：检索用的过滤条件，以及快速路径直接给出的回答（不能直接回答时为None）
+    """
+    if query_planner is None:
+        return None, None
+    plan = query_planner.plan(question)
+    answer = query_planner.answer(plan) if fast_path_enabled else None
+    return plan.where(), answer
+
+def lexical_fast_path(question, where=None):
+    """
+    问题中精确包含人名或电影名且词法得分明显领先时，只用倒排索引检索（不调用嵌入接口）
+    Returns:
+        (ids, documents)，不满足条件时返回None
+    """
+    if lexical_index is None:
+        return None
+    return lexical_index.entity_search(question, n_candidates, where, lexical_confidence)
+
+def search(questions, query_embeddings, where=None):
+    """
+    混合检索：有倒排索引时把词法检索结果与向量检索结果按倒数排名融合
+    """
+    results = vector_search(query_embeddings, where)
+    if lexical_index is not None:
+        for i, question in enumerate(questions):
+            results['ids'][i], results['documents'][i] = reciprocal_rank_fusion(
+                [(results['ids'][i], results['documents'][i]), lexical_index.search(question, n_candidates, where)],
+                n_candidates
+            )
+    return results
+
+def vector_search(query_embeddings, where=None):
+    """
+    向量检索，过滤后没有结果的问题回退到不带过滤条件的检索
+    """
+    results = collection.query(query_embeddings=query_embeddings, n_results=n_candidates, where=where)
+    if where is None:
+        return results
+    empty = [i for i, ids in enumerate(results['ids']) if not ids]
+    if empty:
+        fallback = collection.query(
+            query_embeddings=[query_embeddings[i] for i in empty],
+            n_results=n_candidates
         )
-        # 提取嵌入向量
-        embeddings = [item.embedding for item in response.data]
-        return embeddings
+        for j, i in enumerate(empty):
+            results['ids'][i] = fallback['ids'][j]
+            results['documents'][i] = fallback['documents'][j]
+    return results
 
-# 初始化Chroma客户端和集合
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
+def prepare_chat(question):
+    """
+    检索相关文档并构建发送给LLM的消息
+    Args:
+        question: 用户问题
+    Returns:
+        (messages, cached_answer, cache_key)，命中回答缓存时cached_answer为缓存的回答
+    """
+    # 1. 规划查询：事实查询直接回答，其他问题得到元数据过滤条件
+    where, planned_answer = plan_question(question)
+    if planned_answer is not None:
+        return None, planned_answer, None
+    
+    # 2. 实体查询只用倒排索引检索，其他问题在Chroma中做混合检索（问题向量同时用于回答缓存）
+    lexical = lexical_fast_path(question, where)
+    if lexical is not None:
+        return build_chat(question, None, *lexical)
+    question_embedding = embedding_function([question])[0]
+    results = search([question], [question_embedding], where)
+    documents = results['documents'][0] if results['documents'] else []
+    return build_chat(question, question_embedding, results['ids'][0], documents)
+
+def build_chat(question, question_embedding, result_ids, result_documents):
+    """
+    根据检索结果构建发送给LLM的消息
+    Args:
+        question: 用户问题
+        question_embedding: 问题向量，为None时（未计算问题向量）不使用回答缓存
+        result_ids: 按相关度排序的候选文档ID
+        result_documents: 候选文档内容
+    Returns:
+        (messages, cached_answer, cache_key)，命中回答缓存时cached_answer为缓存的回答
+    """
+    # 3. 在token预算内组装上下文，去掉近似重复的文档
+    ids, contexts, _ = pack_context(result_ids, result_documents, context_token_budget)
+    
+    # 相似问题且检索到相同文档时直接返回缓存的回答
+    cache_key = None
+    if question_embedding is not None:
+        cache_key = (question_embedding, context_fingerprint(ids, contexts))
+    if answer_cache is not None and cache_key is not None:
+        cached_answer = answer_cache.lookup(*cache_key)
+        if cached_answer is not None:
+            return None, cached_answer, cache_key
+    
+    if not contexts:
+        context_str = "没有找到相关的奥斯卡获奖数据。"
+    else:
+        context_str = "\n".join([f"相关数据 {i+1}: {doc}" for i, doc in enumerate(contexts)])
+    
+    # 4. 构建prompt（不带缩进，避免浪费token）
+    prompt = (
+        "你是一个基于奥斯卡获奖数据集的智能问答助手。请根据提供的上下文信息，回答用户的问题。\n"
+        f"上下文信息：\n{context_str}\n"
+        f"用户问题：{question}\n"
+        "请基于上下文信息，用中文回答用户的问题。如果上下文信息不足，请明确说明。"
+    )
+    return [{"role": "user", "content": prompt}], None, cache_key
 
-# 获取集合，使用自定义OpenAI嵌入函数
-collection = chroma_client.get_collection(
-    name="oscar_awards",
-    embedding_function=OpenAIEmbeddingFunction()
-)
+def remember_answer(cache_key, answer):
+    """
+    把LLM的回答写入回答缓存
+    """
+    if answer_cache is not None and cache_key is not None and answer:
+        answer_cache.store(*cache_key, answer)
+
+def generate_answer(messages, cache_key):
+    """
+    调用LLM生成回答并写入回答缓存
+    """
+    completion = get_client("qwen").chat.completions.create(
+        model=os.environ.get("CHAT_MODEL"), 
+        messages=messages, 
+        max_tokens=1000, 
+        temperature=0.5
+    )
+    
+    answer = completion.choices[0].message.content
+    remember_answer(cache_key, answer)
+    return answer
 
 def rag_chat(question):
     """
@@ -53,51 +209,260 @@ def rag_chat(question):
         LLM生成的回答
     """
     try:
-        # 1. 在Chroma中搜索相关文档
-        results = collection.query(
-            query_texts=[question],
-            n_results=5
-        )
-        
-        # 2. 构建上下文
-        contexts = results['documents'][0] if results['documents'] and results['documents'][0] else []
-        
-        if not contexts:
-            context_str = "没有找到相关的奥斯卡获奖数据。"
-        else:
-            context_str = "\n".join([f"相关数据 {i+1}: {doc}" for i, doc in enumerate(contexts)])
-        
-        # 3. 构建prompt
-        prompt = f"""
-        你是一个基于奥斯卡获奖数据集的智能问答助手。请根据提供的上下文信息，回答用户的问题。
-        
-        上下文信息：
-        {context_str}
+        messages, cached_answer, cache_key = prepare_chat(question)
+        if cached_answer is not None:
+            return cached_answer
         
-        用户问题：{question}
-        
-        请基于上下文信息，用中文回答用户的问题。如果上下文信息不足，请明确说明。
-        """
-        
-        # 4. 调用LLM生成回答
-        messages = [{"role": "user", "content": prompt}]
-        client = openai.OpenAI(
-            api_key=openai.api_key,
-            base_url=openai.base_url
-        )
-        completion = client.chat.completions.create(
-            model=os.environ.get("CHAT_MODEL"), 
-            messages=messages, 
-            max_tokens=1000, 
-            temperature=0.5
-        )
-        
-        return completion.choices[0].message.content
+        # 5. 调用LLM生成回答
+        return generate_answer(messages, cache_key)
     except Exception as e:
         # 直接抛出异常，不输出额外信息
         raise
 
+def rag_chat_stream(question):
+    """
+    流式版本的RAG聊天函数，逐段产出LLM生成的回答
+    Args:
+        question: 用户问题
+    Returns:
+        生成器，每次产出一段新增的回答文本
+    """
+    messages, cached_answer, cache_key = prepare_chat(question)
+    if cached_answer is not None:
+        yield cached_answer
+        return
+    
+    stream = get_client("qwen").chat.completions.create(
+        model=os.environ.get("CHAT_MODEL"), 
+        messages=messages, 
+        max_tokens=1000, 
+        temperature=0.5,
+        stream=True
+    )
+    
+    parts = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    remember_answer(cache_key, "".join(parts))
+
+def rag_chat_batch(questions, max_workers=8, chunk_size=100):
+    """
+    批量回答问题：每批问题用多输入的嵌入请求一次生成向量，按过滤条件分组后用多向量查询检索，
+    再把LLM调用分发到有界线程池并发执行
+    Args:
+        questions: 问题的可迭代对象
+        max_workers: 并发的LLM调用数
+        chunk_size: 每批嵌入和检索的问题数
+    Returns:
+        生成器，按输入顺序产出 {"response": ...} 或 {"error": ...}；缺少问题（None或空字符串）时产出错误
+    """
+    # 与导入共用每个嵌入请求的最大文本数
+    embed_batch_size = max_embed_inputs()
+
+    def answer(prepared):
+        if isinstance(prepared, Exception):
+            raise prepared
+        messages, cached_answer, cache_key = prepared
+        if cached_answer is not None:
+            return cached_answer
+        return generate_answer(messages, cache_key)
+
+    def prepare_chunk(chunk):
+        prepared = [None] * len(chunk)
+        # 快速路径直接回答和只用倒排索引检索的问题不需要嵌入；其余问题按过滤条件分组，每组一次多向量查询
+        groups = {}
+        for i, question in enumerate(chunk):
+            if not isinstance(question, str) or not question.strip():
+                # 不嵌入、不调用LLM，直接在结果中返回错误
+                prepared[i] = ValueError("缺少参数：需要用户问题")
+                continue
+            where, planned_answer = plan_question(question)
+            lexical = None if planned_answer is not None else lexical_fast_path(question, where)
+            if planned_answer is not None:
+                prepared[i] = (None, planned_answer, None)
+            elif lexical is not None:
+                prepared[i] = build_chat(question, None, *lexical)
+            else:
+                groups.setdefault(json.dumps(where, sort_keys=True), (where, []))[1].append(i)
+        remaining = [i for _, indices in groups.values() for i in indices]
+        embeddings = {}
+        for start in range(0, len(remaining), embed_batch_size):
+            batch = remaining[start:start + embed_batch_size]
+            for i, embedding in zip(batch, embedding_function([chunk[i] for i in batch])):
+                embeddings[i] = embedding
+        for where, indices in groups.values():
+            results = search([chunk[i] for i in indices], [embeddings[i] for i in indices], where)
+            for i, ids, documents in zip(indices, results['ids'], results['documents']):
+                prepared[i] = build_chat(chunk[i], embeddings[i], ids, documents)
+        return prepared
+
+    def outcome(future):
+        try:
+            return {"response": future.result()}
+        except Exception as e:
+            return {"error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        chunk = []
+        for question in questions:
+            chunk.append(question)
+            if len(chunk) < chunk_size:
+                continue
+            pending.extend(_submit_chunk(executor, prepare_chunk, answer, chunk))
+            chunk = []
+            # 前面的问题已经回答完成时及时输出，同时限制排队的任务数
+            while pending and (pending[0].done() or len(pending) > max_workers * 4):
+                yield outcome(pending.popleft())
+        if chunk:
+            pending.extend(_submit_chunk(executor, prepare_chunk, answer, chunk))
+        while pending:
+            yield outcome(pending.popleft())
+
+def _submit_chunk(executor, prepare_chunk, answer, chunk):
+    try:
+        prepared = prepare_chunk(chunk)
+    except Exception as e:
+        # 整批检索失败时，这一批的每个问题都返回同样的错误
+        failed = executor.submit(_raise, e)
+        return [failed] * len(chunk)
+    return [executor.submit(answer, item) for item in prepared]
+
+def _raise(error):
+    raise error
+
+def read_batch_questions(stream):
+    """
+    从JSONL输入中读取问题，每行可以是 {"question": "...", ...} 或纯文本问题
+    Returns:
+        生成器，产出 (原始记录, 问题, 错误)：不是JSON的行整行作为问题；
+        是JSON但不是对象的行（如 null、[1, 2]）产出错误，问题为None；
+        对象中的 question 不是字符串时原样产出，由 rag_chat_batch 返回错误
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            yield {"question": line}, line, None
+            continue
+        if not isinstance(record, dict):
+            yield {}, None, "无效的请求: 请求必须是JSON对象"
+            continue
+        yield record, record.get("question"), None
+
+def run_batch(stream, max_workers=8):
+    """
+    批量模式：读取JSONL问题，按输入顺序逐行输出JSONL结果
+    """
+    records = deque()
+
+    def questions():
+        for record, question, error in read_batch_questions(stream):
+            records.append((record, error))
+            # 无效的行也要占一个位置以保持输出顺序，问题为None时不会嵌入或调用LLM
+            yield question
+
+    for result in rag_chat_batch(questions(), max_workers=max_workers):
+        record, error = records.popleft()
+        if error is not None:
+            result = {"error": error}
+        print(json.dumps({**record, **result}, ensure_ascii=False), flush=True)
+
+def cache_stats():
+    """
+    返回回答缓存和嵌入缓存的命中统计
+    """
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "embedding_cache": embedding_function.cache.stats() if embedding_function.cache is not None else None,
+    }
+
+def serve(max_workers=4):
+    """
+    常驻服务模式：集合和客户端只加载一次，从标准输入逐行读取JSON请求，
+    并发处理后把JSON结果逐行写到标准输出
+    请求格式: {"id": 1, "question": "...", "stream": false}
+    响应格式: {"id": 1, "response": "..."} 或 {"id": 1, "error": "..."}
+    流式请求会先逐段返回 {"id": 1, "delta": "..."}，最后返回完整的 {"id": 1, "response": "..."}
+    统计请求: {"id": 1, "stats": true}，返回回答缓存和嵌入缓存的命中统计
+    """
+    output_lock = threading.Lock()
+
+    def write(message):
+        with output_lock:
+            sys.stdout.write(json.dumps(message, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+
+    def handle(request):
+        try:
+            if request.get("stream"):
+                parts = []
+                for delta in rag_chat_stream(request["question"]):
+                    parts.append(delta)
+                    write({"id": request.get("id"), "delta": delta})
+                write({"id": request.get("id"), "response": "".join(parts)})
+                return
+            write({"id": request.get("id"), "response": rag_chat(request["question"])})
+        except Exception as e:
+            write({"id": request.get("id"), "error": str(e)})
+
+    # 通知调用方已经完成加载，可以开始接收请求
+    write({"ready": True})
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                write({"id": None, "error": f"无效的请求: {e}"})
+                continue
+            if not isinstance(request, dict):
+                write({"id": None, "error": "无效的请求: 请求必须是JSON对象"})
+                continue
+            if request.get("stats"):
+                write({"id": request.get("id"), "stats": cache_stats()})
+                continue
+            if not request.get("question"):
+                write({"id": request.get("id"), "error": "缺少参数：需要用户问题"})
+                continue
+            executor.submit(handle, request)
+
 if __name__ == "__main__":
+    # 常驻服务模式，供Node服务器的worker池复用
+    if len(sys.argv) > 1 and sys.argv[1] == "--server":
+        serve(int(os.environ.get("RAG_SERVER_THREADS", "4")))
+        sys.exit(0)
+
+    # 批量模式：从JSONL文件（不指定文件时从标准输入）读取问题，按输入顺序输出JSONL结果
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        max_workers = int(os.environ.get("RAG_BATCH_WORKERS", "8"))
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], encoding="utf-8") as f:
+                run_batch(f, max_workers)
+        else:
+            run_batch(sys.stdin, max_workers)
+        sys.exit(0)
+
+    # 流式模式：逐行输出 {"delta": "..."}，最后输出 {"done": true}
+    if len(sys.argv) > 2 and sys.argv[1] == "--stream":
+        try:
+            for delta in rag_chat_stream(sys.argv[2]):
+                print(json.dumps({"delta": delta}), flush=True)
+            print(json.dumps({"done": True}), flush=True)
+        except Exception as e:
+            print(json.dumps({"error": str(e)}), flush=True)
+        sys.exit(0)
+
     # 从命令行获取参数
     if len(sys.argv) < 2:
         print(json.dumps({"error": "缺少参数：需要用户问题"}))
@@ -14,3 +14,5 @@ except Exception as e:
     sys.exit(1)
 
 print("\n集合已成功删除，现在可以重新运行load_data.py来加载数据")
+print("提示：日常更新数据集无需删除集合，直接运行load_data.py会增量同步变化的行")
+print("如果有快照文件，可以运行 python snapshot.py restore 直接恢复集合，无需重新嵌入")
@@ -0,0 +1,289 @@
+# 按颁奖年份分片的集合
+# 导入时每个年份区间（默认每十年）写入一个单独的集合，并记录分片清单(shard_manifest.json)；
+# 查询时根据where条件中的年份只查询相关分片，没有年份条件时并行查询所有分片，按距离合并top-k。
+# ShardedCollection 提供与Chroma集合相同的 add/upsert/delete/get/query/count 接口
+
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chroma_utils import collection_names
+
+DEFAULT_MANIFEST_PATH = "./shard_manifest.json"
+YEAR_FIELD = "year_ceremony"
+
+
+def shard_range(year, span):
+    """
+    返回年份所在分片的 (起始年份, 结束年份)，例如 span=10 时 2023 -> (2020, 2029)
+    """
+    start = year - year % span
+    return start, start + span - 1
+
+
+def shard_name(base_name, start, end):
+    return f"{base_name}_{start}_{end}"
+
+
+def year_bounds(where):
+    """
+    从where条件中提取颁奖年份的范围
+    Returns:
+        (最小年份, 最大年份)，某一端没有限制时为None；没有年份条件时返回None
+    """
+    if not where:
+        return None
+    low, high = None, None
+    for key, condition in where.items():
+        bounds = None
+        if key == "$and":
+            for sub in condition:
+                sub_bounds = year_bounds(sub)
+                if sub_bounds is not None:
+                    low, high = _intersect((low, high), sub_bounds)
+            continue
+        if key != YEAR_FIELD:
+            # $or 等条件无法确定范围，按不限制处理
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, value in condition.items():
+            if op == "$eq":
+                bounds = (value, value)
+            elif op == "$in" and value:
+                bounds = (min(value), max(value))
+            elif op in ("$gt", "$gte"):
+                bounds = (value + (op == "$gt"), None)
+            elif op in ("$lt", "$lte"):
+                bounds = (None, value - (op == "$lt"))
+            else:
+                continue
+            low, high = _intersect((low, high), bounds)
+    if low is None and high is None:
+        return None
+    return low, high
+
+
+def _intersect(first, second):
+    low = second[0] if first[0] is None else first[0] if second[0] is None else max(first[0], second[0])
+    high = second[1] if first[1] is None else first[1] if second[1] is None else min(first[1], second[1])
+    return low, high
+
+
+def find_shards(chroma_client, base_name):
+    """
+    查找数据库中已有的分片集合（包括其他分片跨度的）
+    Returns:
+        {(起始年份, 结束年份): 集合名称}
+    """
+    pattern = re.compile(rf"^{re.escape(base_name)}_(\d+)_(\d+)$")
+    shards = {}
+    for name in collection_names(chroma_client):
+        match = pattern.match(name)
+        if match:
+            shards[(int(match.group(1)), int(match.group(2)))] = name
+    return shards
+
+
+def load_manifest(path=DEFAULT_MANIFEST_PATH):
+    """
+    读取分片清单，不存在时返回None
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ShardedCollection:
+    """
+    按年份分片的集合
+    Args:
+        chroma_client: Chroma客户端
+        base_name: 集合基础名称，分片名称为 {base_name}_{起始年份}_{结束年份}
+        span: 每个分片包含的年份数
+        embedding_function: 分片集合使用的嵌入函数
+        max_workers: 并行查询分片的线程数，默认为（查询时的）分片数
+        create_metadata: 创建新分片时使用的集合元数据（HNSW参数）
+    """
+
+    def __init__(self, chroma_client, base_name, span=10, embedding_function=None, max_workers=None,
+                 create_metadata=None):
+        self.chroma_client = chroma_client
+        self.name = base_name
+        self.span = span
+        self.embedding_function = embedding_function
+        self.create_metadata = create_metadata
+        self.shards = {}  # (起始年份, 结束年份) -> 集合
+        # 只使用跨度相同的分片，其他跨度的旧分片由 load_data.py 删除
+        for (start, end), name in find_shards(chroma_client, base_name).items():
+            if end - start + 1 == span:
+                self.shards[(start, end)] = chroma_client.get_collection(name=name, embedding_function=embedding_function)
+        # 并行查询的线程池在第一次需要时按当时的分片数创建，新建分片后按需扩大
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_workers = 0
+        self._executor_lock = threading.Lock()
+
+    @property
+    def metadata(self):
+        first = self._ordered()[:1]
+        return first[0].metadata if first else None
+
+    def shard_for(self, year):
+        """
+        返回年份所在的分片集合（不存在时创建）
+        """
+        key = shard_range(year, self.span)
+        if key not in self.shards:
+            self.shards[key] = self.chroma_client.get_or_create_collection(
+                name=shard_name(self.name, *key),
+                metadata=self.create_metadata,
+                embedding_function=self.embedding_function
+            )
+        return self.shards[key]
+
+    def drop_shard(self, year):
+        """
+        删除年份所在的分片，用于单独重建一个分片
+        """
+        key = shard_range(year, self.span)
+        if key in self.shards:
+            self.chroma_client.delete_collection(shard_name(self.name, *key))
+            del self.shards[key]
+
+    def drop_all(self):
+        """
+        删除所有分片
+        """
+        for key in list(self.shards):
+            self.chroma_client.delete_collection(shard_name(self.name, *key))
+        self.shards.clear()
+
+    def add(self, ids, documents, metadatas, embeddings):
+        self._write("add", ids, documents, metadatas, embeddings)
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self._write("upsert", ids, documents, metadatas, embeddings)
+
+    def delete(self, ids):
+        for shard in self.shards.values():
+            shard.delete(ids=ids)
+
+    def count(self):
+        return sum(shard.count() for shard in self.shards.values())
+
+    def get(self, include=("documents", "metadatas"), limit=None, offset=0):
+        """
+        按分片的年份顺序分页读取记录，返回与 collection.get 相同结构的结果
+        """
+        results = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        for shard in self._ordered():
+            if limit is not None and len(results["ids"]) >= limit:
+                break
+            size = shard.count()
+            if offset >= size:
+                offset -= size
+                continue
+            remaining = None if limit is None else limit - len(results["ids"])
+            page = shard.get(include=list(include), limit=remaining, offset=offset)
+            offset = 0
+            results["ids"].extend(page["ids"])
+            for field in ("documents", "metadatas", "embeddings"):
+                if field in include:
+                    results[field].extend(page[field])
+        for field in ("documents", "metadatas", "embeddings"):
+            if field not in include:
+                results[field] = None
+        return results
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        """
+        只查询与where中年份范围相交的分片（没有年份条件时查询所有分片），按距离合并结果
+        """
+        targets = self.route(where)
+        merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not targets:
+            for field in merged:
+                merged[field] = [[] for _ in query_embeddings]
+            return merged
+
+        def search(shard):
+            return shard.query(query_embeddings=query_embeddings, n_results=n_results, where=where,
+                               include=["documents", "metadatas", "distances"])
+
+        if len(targets) == 1:
+            results = [search(targets[0])]
+        else:
+            results = list(self._query_executor().map(search, targets))
+        for i in range(len(query_embeddings)):
+            candidates = []
+            for result in results:
+                candidates.extend(zip(result["distances"][i], result["ids"][i],
+                                      result["documents"][i], result["metadatas"][i]))
+            candidates.sort(key=lambda candidate: candidate[0])
+            top = candidates[:n_results]
+            merged["distances"].append([candidate[0] for candidate in top])
+            merged["ids"].append([candidate[1] for candidate in top])
+            merged["documents"].append([candidate[2] for candidate in top])
+            merged["metadatas"].append([candidate[3] for candidate in top])
+        return merged
+
+    def route(self, where):
+        """
+        返回需要查询的分片
+        """
+        bounds = year_bounds(where)
+        if bounds is None:
+            return self._ordered()
+        low, high = bounds
+        return [
+            shard for (start, end), shard in sorted(self.shards.items())
+            if (low is None or end >= low) and (high is None or start <= high)
+        ]
+
+    def manifest(self):
+        """
+        生成分片清单
+        """
+        return {
+            "base": self.name,
+            "span": self.span,
+            "shards": [
+                {"name": shard.name, "start": start, "end": end, "count": shard.count()}
+                for (start, end), shard in sorted(self.shards.items())
+            ],
+        }
+
+    def save_manifest(self, path=DEFAULT_MANIFEST_PATH):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest(), f, ensure_ascii=False, indent=2)
+
+    def _query_executor(self):
+        workers = self.max_workers or max(1, len(self.shards))
+        with self._executor_lock:
+            if self._executor is None or self._executor_workers < workers:
+                previous = self._executor
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-query")
+                self._executor_workers = workers
+                if previous is not None:
+                    # 正在执行的查询仍在旧线程池中完成
+                    previous.shutdown(wait=False)
+            return self._executor
+
+    def _ordered(self):
+        return [shard for _, shard in sorted(self.shards.items())]
+
+    def _write(self, method, ids, documents, metadatas, embeddings):
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(shard_range(int(metadata[YEAR_FIELD]), self.span), []).append(i)
+        for (start, _), indices in groups.items():
+            getattr(self.shard_for(start), method)(
+                ids=[ids[i] for i in indices],
+                documents=[documents[i] for i in indices],
+                metadatas=[metadatas[i] for i in indices],
+                embeddings=[embeddings[i] for i in indices]
+            )
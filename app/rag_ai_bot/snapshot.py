@@ -0,0 +1,212 @@
+# 集合快照导出/恢复
+# 分页读取集合中的ID、文档、元数据和向量，每页写入压缩快照文件（zip）中的一个分块（JSONL记录 + float16向量的.npy），
+# 导出和恢复的内存占用只与页大小有关；分片模式下每个分片集合各自导出，恢复后仍是相同跨度的分片。
+# 恢复时直接用快照中的向量大批量 add，不调用嵌入接口，可用于迁移到其他机器或回滚有问题的导入
+
+import argparse
+import io
+import json
+import os
+import time
+import zipfile
+
+import numpy as np
+
+from chroma_utils import collection_names, iter_collection
+from shards import ShardedCollection, find_shards
+
+DEFAULT_SNAPSHOT_PATH = "./oscar_awards.snapshot.zip"
+SNAPSHOT_VERSION = 2
+
+
+def export_snapshot(collection, path=DEFAULT_SNAPSHOT_PATH, dtype="float16", page_size=1000):
+    """
+    导出集合快照
+    Args:
+        collection: Chroma集合或 ShardedCollection（每个分片导出为快照中的一个集合）
+        path: 快照文件路径
+        dtype: 向量的存储精度，"float16"（体积减半）或 "float32"
+        page_size: 每次从集合读取的记录数，每页写入一个分块
+    Returns:
+        导出的记录数
+    """
+    sharded = isinstance(collection, ShardedCollection)
+    sources = [shard for _, shard in sorted(collection.shards.items())] if sharded else [collection]
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        entries = [_export_collection(bundle, source, dtype, page_size) for source in sources]
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "collections": entries,
+            "shards": {"base": collection.name, "span": collection.span} if sharded else None,
+            "dtype": dtype,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        bundle.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False))
+    return sum(entry["count"] for entry in entries)
+
+
+def _export_collection(bundle, collection, dtype, page_size):
+    """
+    把一个集合逐页写入快照，返回该集合在清单中的条目
+    """
+    count, dimension, parts = 0, 0, []
+    for page in iter_collection(collection, ["embeddings", "documents", "metadatas"], page_size):
+        part = f"{collection.name}/{len(parts):05d}"
+        with bundle.open(f"{part}.jsonl", "w") as f:
+            for record in zip(page["ids"], page["documents"], page["metadatas"]):
+                f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        embeddings = np.asarray(page["embeddings"], dtype=dtype)
+        buffer = io.BytesIO()
+        np.save(buffer, embeddings)
+        bundle.writestr(f"{part}.npy", buffer.getvalue())
+        parts.append(part)
+        count += len(page["ids"])
+        dimension = int(embeddings.shape[1])
+    return {"name": collection.name, "metadata": collection.metadata, "count": count,
+            "dimension": dimension, "parts": parts}
+
+
+def read_manifest(bundle):
+    """
+    读取快照清单（兼容只有一个集合、整体写入的第1版快照）
+    """
+    manifest = json.loads(bundle.read("manifest.json"))
+    if manifest.get("version") == 1:
+        return {
+            "version": 1,
+            "collections": [{"name": manifest["collection"], "metadata": manifest.get("metadata"),
+                             "count": manifest["count"], "dimension": manifest["dimension"], "parts": None}],
+            "shards": None,
+            "dtype": manifest.get("dtype"),
+            "created_at": manifest.get("created_at"),
+        }
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"不支持的快照版本: {manifest.get('version')}")
+    return manifest
+
+
+def iter_parts(bundle, entry):
+    """
+    逐个读取集合的分块
+    Returns:
+        生成器，每次产出 (ids, documents, metadatas, embeddings)
+    """
+    if entry["parts"] is None:
+        # 第1版快照：记录和向量各是一个整体
+        records = json.loads(bundle.read("records.json"))
+        embeddings = np.load(io.BytesIO(bundle.read("embeddings.npy")))
+        yield records["ids"], records["documents"], records["metadatas"], embeddings
+        return
+    for part in entry["parts"]:
+        ids, documents, metadatas = [], [], []
+        with bundle.open(f"{part}.jsonl") as f:
+            for line in f:
+                record_id, document, metadata = json.loads(line)
+                ids.append(record_id)
+                documents.append(document)
+                metadatas.append(metadata)
+        yield ids, documents, metadatas, np.load(io.BytesIO(bundle.read(f"{part}.npy")))
+
+
+def restore_snapshot(chroma_client, path=DEFAULT_SNAPSHOT_PATH, name=None, embedding_function=None,
+                     replace=False, batch_size=5000):
+    """
+    从快照恢复集合（使用快照中的向量，不调用嵌入接口）
+    Args:
+        chroma_client: Chroma客户端
+        path: 快照文件路径
+        name: 恢复后的集合名称（分片快照为分片的基础名称），默认使用快照中的名称
+        embedding_function: 集合使用的嵌入函数（只用于之后的查询）
+        replace: 集合已存在时是否删除后重建（分片快照会删除该基础名称下的所有分片）
+        batch_size: 每次 add 的记录数（不超过Chroma允许的最大批次）
+    Returns:
+        恢复后的集合，分片快照返回 ShardedCollection
+    """
+    with zipfile.ZipFile(path) as bundle:
+        manifest = read_manifest(bundle)
+        shards = manifest["shards"]
+        entries = manifest["collections"]
+        if shards:
+            base = name or shards["base"]
+            targets = [base + entry["name"][len(shards["base"]):] for entry in entries]
+            existing = list(find_shards(chroma_client, base).values())
+        else:
+            base = name or entries[0]["name"]
+            targets = [base]
+            existing = [base] if base in collection_names(chroma_client) else []
+        if existing:
+            if not replace:
+                raise ValueError(f"集合 {', '.join(existing)} 已存在，使用 --replace 删除后恢复")
+            for existing_name in existing:
+                chroma_client.delete_collection(existing_name)
+
+        if hasattr(chroma_client, "get_max_batch_size"):
+            batch_size = min(batch_size, chroma_client.get_max_batch_size())
+        for entry, target in zip(entries, targets):
+            collection = chroma_client.create_collection(
+                name=target,
+                metadata=entry.get("metadata") or None,
+                embedding_function=embedding_function
+            )
+            for ids, documents, metadatas, embeddings in iter_parts(bundle, entry):
+                for start in range(0, len(ids), batch_size):
+                    end = start + batch_size
+                    collection.add(
+                        ids=ids[start:end],
+                        documents=documents[start:end],
+                        metadatas=metadatas[start:end],
+                        embeddings=embeddings[start:end].astype(np.float32)
+                    )
+    if shards:
+        return ShardedCollection(chroma_client, base, shards["span"], embedding_function)
+    return collection
+
+
+if __name__ == "__main__":
+    import chromadb
+    from dotenv import load_dotenv
+    from embedding import create_embedding_function
+    from lexical_index import DEFAULT_LEXICAL_INDEX_PATH, LexicalIndex
+    from shards import DEFAULT_MANIFEST_PATH
+
+    load_dotenv(dotenv_path='../../.env')
+    # 与 load_data.py 相同：OSCAR_SHARD_YEARS 大于0时导出按年份分片的集合
+    shard_years = int(os.environ.get("OSCAR_SHARD_YEARS", "0"))
+    manifest_path = os.environ.get("RAG_SHARD_MANIFEST", DEFAULT_MANIFEST_PATH)
+
+    parser = argparse.ArgumentParser(description="导出或恢复 oscar_awards 集合快照")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="导出集合快照")
+    export_parser.add_argument("path", nargs="?", default=DEFAULT_SNAPSHOT_PATH, help="快照文件路径")
+    export_parser.add_argument("--collection", default="oscar_awards", help="集合名称（分片模式下为分片的基础名称）")
+    export_parser.add_argument("--dtype", choices=("float16", "float32"), default="float16", help="向量存储精度")
+    restore_parser = subparsers.add_parser("restore", help="从快照恢复集合")
+    restore_parser.add_argument("path", nargs="?", default=DEFAULT_SNAPSHOT_PATH, help="快照文件路径")
+    restore_parser.add_argument("--collection", default=None, help="恢复后的集合名称，默认使用快照中的名称")
+    restore_parser.add_argument("--replace", action="store_true", help="集合已存在时删除后恢复")
+    args = parser.parse_args()
+
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    started = time.monotonic()
+    if args.command == "export":
+        if shard_years > 0:
+            source = ShardedCollection(chroma_client, args.collection, shard_years)
+            if not source.shards:
+                parser.error(f"没有找到跨度为 {shard_years} 年的 {args.collection} 分片")
+        else:
+            source = chroma_client.get_collection(name=args.collection)
+        exported = export_snapshot(source, args.path, args.dtype)
+        print(f"已导出 {exported} 条记录到 {args.path}，耗时 {time.monotonic() - started:.1f} 秒")
+    else:
+        restored = restore_snapshot(
+            chroma_client, args.path, args.collection,
+            embedding_function=create_embedding_function(), replace=args.replace
+        )
+        # 分片快照恢复后写入分片清单，rag_chat 据此按年份路由；单集合快照恢复后删除过期的清单
+        if isinstance(restored, ShardedCollection):
+            restored.save_manifest(manifest_path)
+        elif os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        # 恢复后的集合与倒排索引保持一致
+        LexicalIndex.from_collection(restored).save(os.environ.get("RAG_LEXICAL_INDEX", DEFAULT_LEXICAL_INDEX_PATH))
+        print(f"已恢复 {restored.count()} 条记录到集合 {restored.name}，耗时 {time.monotonic() - started:.1f} 秒")
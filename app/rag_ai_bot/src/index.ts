@@ -1,7 +1,7 @@
 import express, { Request, Response } from 'express';
 import * as path from 'path';
-import { PythonShell } from 'python-shell';
 import * as dotenv from 'dotenv';
+import { RagWorkerPool } from './ragWorkerPool';
 
 // 加载环境变量
 console.log('正在加载环境变量...');
@@ -11,10 +11,37 @@ console.log('环境变量加载完成');
 const app = express();
 const PORT = process.env.PORT || 3000;
 
+// 常驻的 rag_chat.py worker 池，避免每个请求都重新启动 Python 并加载集合
+const ragPool = new RagWorkerPool(
+  path.join(__dirname, '../rag_chat.py'),
+  Number(process.env.RAG_WORKERS || 2),
+  'python', // 或者指定具体的Python路径
+  Number(process.env.RAG_TIMEOUT_MS || 60000)
+);
+
 // 配置中间件
 app.use(express.json());
 app.use(express.static(path.join(__dirname, '../public')));
 
+// 客户端通过 Accept: text/event-stream 请求流式回答
+function wantsStream(req: Request): boolean {
+  return (req.headers.accept || '').includes('text/event-stream');
+}
+
+function startSse(res: Response) {
+  res.writeHead(200, {
+    'Content-Type': 'text/event-stream; charset=utf-8',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive'
+  });
+}
+
+function sendSse(res: Response, payload: object) {
+  if (!res.writableEnded) {
+    res.write(`data: ${JSON.stringify(payload)}\n\n`);
+  }
+}
+
 // 聊天API端点
 app.post('/api/chat', (req: Request, res: Response) => {
   try {
@@ -25,30 +52,30 @@ app.post('/api/chat', (req: Request, res: Response) => {
       return res.status(400).json({ error: '缺少必要参数：question' });
     }
     
-    // 调用Python脚本
-    const options = {
-      args: [question],
-      pythonPath: 'python' // 或者指定具体的Python路径
-    };
-    
-    // 使用PythonShell调用rag_chat.py脚本
-    PythonShell.run(path.join(__dirname, '../rag_chat.py'), options)
-      .then((results) => {
-        try {
-          // 解析Python脚本的输出
-          const result = JSON.parse(results[0]);
-          if (result.error) {
-            return res.status(500).json({ error: result.error });
+    // 流式模式：把 worker 返回的增量回答以 Server-Sent Events 转发给浏览器
+    if (wantsStream(req)) {
+      startSse(res);
+      // 客户端断开时停止转发，并丢弃 worker 池中未完成的请求
+      const controller = new AbortController();
+      res.on('close', () => controller.abort());
+      ragPool.ask(question, (delta) => sendSse(res, { delta }), controller.signal)
+        .then(() => {
+          sendSse(res, { done: true });
+          res.end();
+        })
+        .catch((err) => {
+          if (controller.signal.aborted) {
+            return;
           }
-          return res.json({ response: result.response });
-        } catch (parseError) {
-          console.error('解析Python输出错误:', parseError);
-          return res.status(500).json({ 
-            error: '解析Python输出错误', 
-            details: parseError instanceof Error ? parseError.message : String(parseError) 
-          });
-        }
-      })
+          sendSse(res, { error: err instanceof Error ? err.message : String(err) });
+          res.end();
+        });
+      return;
+    }
+    
+    // 交给常驻的 Python worker 处理
+    ragPool.ask(question)
+      .then((response) => res.json({ response }))
       .catch((err) => {
         console.error('Python脚本执行错误:', err);
         return res.status(500).json({ 
@@ -72,8 +99,14 @@ app.get('/health', (req: Request, res: Response) => {
 
 // 启动服务器
 console.log('正在启动服务器...');
-app.listen(PORT, () => {
+const server = app.listen(PORT, () => {
   console.log(`奥斯卡获奖数据 RAG AI Bot服务器已启动，端口：${PORT}`);
   console.log(`访问地址：http://localhost:${PORT}`);
   console.log(`健康检查地址：http://localhost:${PORT}/health`);
+});
+
+// 退出时关闭 worker 进程
+process.on('SIGINT', () => {
+  ragPool.close();
+  server.close(() => process.exit(0));
 });
\ No newline at end of file
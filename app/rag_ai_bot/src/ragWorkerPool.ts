@@ -0,0 +1,209 @@
+import { PythonShell } from 'python-shell';
+
+interface PendingRequest {
+  resolve: (response: string) => void;
+  reject: (error: Error) => void;
+  onDelta?: (delta: string) => void;
+  timer: NodeJS.Timeout;
+}
+
+interface WorkerRequest {
+  id: number;
+  question: string;
+  stream: boolean;
+}
+
+interface WorkerMessage {
+  id?: number | null;
+  ready?: boolean;
+  delta?: string;
+  response?: string;
+  error?: string;
+}
+
+// 重启间隔从1秒开始每次翻倍，最长30秒；连续多次在就绪前退出时不再重启
+const RESTART_DELAY_MS = 1000;
+const MAX_RESTART_DELAY_MS = 30000;
+const MAX_STARTUP_FAILURES = 5;
+
+// 单个常驻的 rag_chat.py --server 进程
+class RagWorker {
+  private shell!: PythonShell;
+  private closing = false;
+  // 进程发出 ready 之前收到的请求先排队，就绪后再发送
+  private queued: WorkerRequest[] = [];
+  private restartDelay = RESTART_DELAY_MS;
+  private startupFailures = 0;
+  alive = false;
+  ready = false;
+  // 启动连续失败，不再重启
+  failed = false;
+  readonly pending = new Map<number, PendingRequest>();
+
+  constructor(private readonly scriptPath: string, private readonly pythonPath: string) {
+    this.spawn();
+  }
+
+  private spawn() {
+    this.shell = new PythonShell(this.scriptPath, {
+      mode: 'json',
+      args: ['--server'],
+      pythonPath: this.pythonPath
+    });
+    this.alive = true;
+    this.ready = false;
+
+    this.shell.on('message', (message: WorkerMessage) => {
+      if (message.ready) {
+        console.log('RAG worker 已就绪');
+        this.ready = true;
+        this.restartDelay = RESTART_DELAY_MS;
+        this.startupFailures = 0;
+        const queued = this.queued;
+        this.queued = [];
+        // 排队期间已超时的请求不再发送
+        queued
+          .filter((request) => this.pending.has(request.id))
+          .forEach((request) => this.shell.send(request));
+        return;
+      }
+      if (message.id === undefined || message.id === null) {
+        console.error('RAG worker 返回错误:', message.error);
+        return;
+      }
+      const request = this.pending.get(message.id);
+      if (!request) {
+        return;
+      }
+      if (message.delta !== undefined) {
+        // 流式请求的增量片段
+        request.onDelta?.(message.delta);
+        return;
+      }
+      this.pending.delete(message.id);
+      clearTimeout(request.timer);
+      if (message.error) {
+        request.reject(new Error(message.error));
+      } else {
+        request.resolve(message.response ?? '');
+      }
+    });
+
+    this.shell.on('stderr', (line: string) => {
+      console.error('RAG worker:', line);
+    });
+
+    this.shell.on('error', (err: Error) => {
+      console.error('RAG worker 进程错误:', err);
+    });
+
+    this.shell.on('close', () => {
+      const wasReady = this.ready;
+      this.alive = false;
+      this.ready = false;
+      // 进程退出时让所有未完成的请求失败（包括排队中的），并按退避间隔自动重启
+      this.queued = [];
+      this.rejectAll(new Error('RAG worker 进程已退出'));
+      if (this.closing) {
+        return;
+      }
+      if (!wasReady && ++this.startupFailures >= MAX_STARTUP_FAILURES) {
+        this.failed = true;
+        console.error(`RAG worker 连续 ${this.startupFailures} 次启动失败，不再重启`);
+        return;
+      }
+      console.error(`RAG worker 进程已退出，${this.restartDelay / 1000} 秒后重启...`);
+      setTimeout(() => {
+        if (!this.closing) {
+          this.spawn();
+        }
+      }, this.restartDelay);
+      this.restartDelay = Math.min(this.restartDelay * 2, MAX_RESTART_DELAY_MS);
+    });
+  }
+
+  ask(
+    id: number,
+    question: string,
+    timeoutMs: number,
+    onDelta?: (delta: string) => void,
+    signal?: AbortSignal
+  ): Promise<string> {
+    return new Promise((resolve, reject) => {
+      if (this.failed) {
+        return reject(new Error('RAG worker 启动失败'));
+      }
+      if (signal?.aborted) {
+        return reject(new Error('请求已取消'));
+      }
+      // 超时从收到请求开始计算，包括等待 worker 就绪的时间
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error('RAG worker 处理超时'));
+      }, timeoutMs);
+      this.pending.set(id, { resolve, reject, onDelta, timer });
+      // 取消后不再转发该请求的增量回答，worker 之后返回的结果直接丢弃
+      signal?.addEventListener('abort', () => {
+        if (this.pending.delete(id)) {
+          clearTimeout(timer);
+          reject(new Error('请求已取消'));
+        }
+      }, { once: true });
+      const request: WorkerRequest = { id, question, stream: onDelta !== undefined };
+      if (this.ready) {
+        this.shell.send(request);
+      } else {
+        this.queued.push(request);
+      }
+    });
+  }
+
+  close() {
+    this.closing = true;
+    this.queued = [];
+    this.rejectAll(new Error('RAG worker 已关闭'));
+    if (this.alive) {
+      this.shell.end(() => undefined);
+    }
+  }
+
+  private rejectAll(error: Error) {
+    for (const [id, request] of this.pending) {
+      clearTimeout(request.timer);
+      request.reject(error);
+      this.pending.delete(id);
+    }
+  }
+}
+
+// 常驻 Python worker 池：集合和客户端只在启动时加载一次，请求分发到负载最小的 worker
+export class RagWorkerPool {
+  private readonly workers: RagWorker[] = [];
+  private nextId = 1;
+
+  constructor(scriptPath: string, size: number, pythonPath = 'python', private readonly timeoutMs = 60000) {
+    for (let i = 0; i < size; i++) {
+      this.workers.push(new RagWorker(scriptPath, pythonPath));
+    }
+  }
+
+  // 传入 onDelta 时以流式方式请求，每收到一段增量回答调用一次，Promise 在回答完成后返回完整内容；
+  // signal 取消时（例如客户端断开）丢弃该请求
+  ask(question: string, onDelta?: (delta: string) => void, signal?: AbortSignal): Promise<string> {
+    // 优先分给已就绪的 worker，都未就绪时排队等待启动中的 worker
+    const usable = this.workers.filter((worker) => !worker.failed);
+    if (usable.length === 0) {
+      return Promise.reject(new Error('所有 RAG worker 都启动失败'));
+    }
+    const ready = usable.filter((worker) => worker.ready);
+    const candidates = ready.length > 0 ? ready : usable;
+    const worker = candidates.reduce((least, current) =>
+      current.pending.size < least.pending.size ? current : least
+    );
+    return worker.ask(this.nextId++, question, this.timeoutMs, onDelta, signal);
+  }
+
+  close() {
+    this.workers.forEach((worker) => worker.close());
+  }
+}
@@ -0,0 +1,57 @@
+# context_packer 的去重测试
+# 用按词切分的编码器代替 tiktoken，测试不依赖下载编码文件
+#
+# 用法：
+#   python -m pytest test_context_packer.py
+
+import re
+
+import pytest
+
+import context_packer
+
+
+def document(year, category, name, film, winner="是"):
+    return f"颁奖年份: {year}\n奖项类别: {category}\n获奖者: {name}\n电影名称: {film}\n是否获奖: {winner}\n"
+
+
+@pytest.fixture(autouse=True)
+def word_encoder(monkeypatch):
+    def encode_batch(texts):
+        return [[hash(word) for word in re.findall(r"\w+|[^\w\s]", text)] for text in texts]
+
+    monkeypatch.setattr(context_packer, "encode_batch", encode_batch)
+
+
+def test_two_near_duplicates_are_deduped():
+    documents = [
+        document(2023, "BEST PICTURE", "Daniel Kwan, Daniel Scheinert and Jonathan Wang",
+                 "Everything Everywhere All at Once"),
+        document(2023, "BEST PICTURE", "Daniel Kwan, Daniel Scheinert, Jonathan Wang",
+                 "Everything Everywhere All at Once"),
+    ]
+    ids, packed, _ = context_packer.pack_context(["a", "b"], documents, token_budget=1000)
+    assert ids == ["a"]
+    # 文档原样放入上下文，保留换行
+    assert packed == documents[:1]
+
+
+def test_different_documents_are_kept():
+    documents = [
+        document(2024, "ACTRESS IN A LEADING ROLE", "Emma Stone", "Poor Things"),
+        document(2024, "ACTOR IN A LEADING ROLE", "Cillian Murphy", "Oppenheimer"),
+    ]
+    ids, _, _ = context_packer.pack_context(["a", "b"], documents, token_budget=1000)
+    assert ids == ["a", "b"]
+
+
+def test_dedupe_does_not_depend_on_other_candidates():
+    near_duplicates = [
+        document(2023, "BEST PICTURE", "Daniel Kwan, Daniel Scheinert and Jonathan Wang",
+                 "Everything Everywhere All at Once"),
+        document(2023, "BEST PICTURE", "Daniel Kwan, Daniel Scheinert, Jonathan Wang",
+                 "Everything Everywhere All at Once"),
+    ]
+    other = document(1930, "OUTSTANDING PRODUCTION", "Metro-Goldwyn-Mayer", "The Broadway Melody")
+    ids, _, _ = context_packer.pack_context(["a", "b", "c"], near_duplicates + [other], token_budget=1000)
+    assert ids == ["a", "c"]
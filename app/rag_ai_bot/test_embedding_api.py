@@ -2,7 +2,8 @@
 
 from dotenv import load_dotenv
 import os
-import openai
+
+from common.llm_clients import get_client
 
 # 加载环境变量
 print("正在加载环境变量...")
@@ -11,9 +12,7 @@ print("环境变量加载完成")
 
 # 配置OpenAI客户端
 print("正在配置OpenAI客户端...")
-openai.api_key = os.environ.get("QWEN_APP_KEY")
-openai.base_url = os.environ.get("QWEN_BASE_URL") + "/"
-openai.api_type = "openai"
+client = get_client("qwen")
 rag_model = os.environ.get("RAG_MODEL")
 
 print(f"OpenAI客户端配置完成")
@@ -27,7 +26,7 @@ print(f"\n测试文本: {texts}")
 # 调用OpenAI Embedding API
 try:
     print("\n正在调用OpenAI Embedding API...")
-    response = openai.embeddings.create(
+    response = client.embeddings.create(
         model=rag_model,
         input=texts
     )
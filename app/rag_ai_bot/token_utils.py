@@ -0,0 +1,30 @@
+# 基于tiktoken的token计数工具
+# 编码器加载较慢，进程内只加载一次
+
+import os
+from functools import lru_cache
+
+import tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding_name=None):
+    """
+    获取（缓存的）tiktoken编码器
+    通义千问没有公开的tiktoken编码，默认用 cl100k_base 近似估算token数
+    """
+    return tiktoken.get_encoding(encoding_name or os.environ.get("TOKEN_ENCODING", "cl100k_base"))
+
+
+def count_tokens(text):
+    """
+    计算单段文本的token数
+    """
+    return len(get_encoder().encode(text, disallowed_special=()))
+
+
+def encode_batch(texts):
+    """
+    批量编码文本（tiktoken内部多线程），返回每段文本的token id列表
+    """
+    return get_encoder().encode_batch(list(texts), disallowed_special=())
@@ -1,70 +1,87 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from datetime import datetime
-from zoneinfo import ZoneInfo
+from datetime import datetime, timezone
+from typing import Annotated
+import gzip
+import hashlib
 import json
 import os
-from dotenv import load_dotenv
+import time
 import openai
+from dotenv import load_dotenv
+
+from common.llm_clients import get_client
+from intent_matcher import IntentMatcher, with_aliases
+from location_resolver import LocationResolver, get_zone
+from tool_registry import ToolRegistry
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
 
 # 加载环境变量
 load_dotenv(dotenv_path="../../.env")
-api_key = os.getenv("QWEN_APP_KEY")
-base_url = os.getenv("QWEN_BASE_URL")
 model_name = os.getenv("TOOL_CALL_MODEL")
+# 简单的查询时间问题由本地意图匹配直接回答，设置为0时所有问题都交给模型
+fast_path_enabled = os.getenv("TOOL_BOT_FAST_PATH", "1") == "1"
+# 模型调用工具后用模板生成最终回复（省掉第二次模型调用），设置为0时由模型生成
+template_reply_enabled = os.getenv("TOOL_BOT_TEMPLATE_REPLY", "1") == "1"
+# 单个请求调用模型的总时间预算（秒），每次调用模型使用剩余的时间作为超时
+request_timeout = float(os.getenv("TOOL_BOT_REQUEST_TIMEOUT", "30"))
+# /api/time/batch 单次最多查询的城市数
+max_batch_cities = int(os.getenv("TOOL_BOT_MAX_BATCH", "200"))
+# /api/cities 的浏览器缓存时间（秒）
+cities_max_age = int(os.getenv("TOOL_BOT_CITIES_MAX_AGE", "300"))
 
 # 加载时区配置文件
 with open('timezone_config.json', 'r', encoding='utf-8') as f:
     timezone_config = json.load(f)
     TIMEZONE_DATA = timezone_config['timezones']
 
-# 初始化 OpenAI 客户端
-openai.api_key = api_key
-openai.base_url = base_url
-openai.api_type = "openai"
+# 城市列表只在启动时序列化和压缩一次，ETag 取内容的哈希
+CITIES_JSON = json.dumps({'cities': list(TIMEZONE_DATA.keys())}, ensure_ascii=False).encode('utf-8')
+CITIES_GZIP = gzip.compress(CITIES_JSON, compresslevel=9)
+CITIES_ETAG = hashlib.sha1(CITIES_JSON).hexdigest()[:16]
 
-# 工具定义
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "get_current_time",
-            "description": "获取当前城市的时间",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "location": {
-                        "type": "string",
-                        "description": "提供location的英文去获取时间, e.g. San Francisco"
-                    }
-                },
-                "required": ["location"]
-            }
-        }
-    }
-]
+# 加载时预编译城市名称索引（最长匹配 + 拼写容错），包括常用城市的中文名称
+location_resolver = LocationResolver(with_aliases(TIMEZONE_DATA))
+intent_matcher = IntentMatcher(location_resolver)
 
-def get_current_time(location: str) -> str:
+# 初始化 OpenAI 客户端（共享连接池）
+client = get_client("qwen")
+
+def upstream(deadline):
+    """
+    返回以请求剩余时间作为超时的客户端（仍共享连接池），超过时间预算时直接抛出超时
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("请求的时间预算已用完")
+    # 超时后不再重试，避免超出请求的时间预算
+    return client.with_options(timeout=remaining, max_retries=0)
+
+# 工具注册表：工具定义由函数签名生成，一轮中的多个工具调用并发执行
+registry = ToolRegistry(default_timeout=float(os.getenv("TOOL_TIMEOUT", "10")))
+
+@registry.tool(description="获取当前城市的时间")
+def get_current_time(location: Annotated[str, "提供location的英文去获取时间, e.g. San Francisco"]) -> str:
     """获取指定城市的当前时间"""
-    location_lower = location.lower()
-    
     # 查找城市对应的时区
-    for key, timezone in TIMEZONE_DATA.items():
-        if key in location_lower:
-            current_time = datetime.now(ZoneInfo(timezone)).strftime("%I:%M %p")
-            return json.dumps({
-                "location": location,
-                "current_time": current_time
-            })
+    match = location_resolver.resolve(location)
+    if match is not None:
+        current_time = datetime.now(get_zone(match.timezone)).strftime("%I:%M %p")
+        return json.dumps({
+            "location": location,
+            "current_time": current_time
+        })
     
     return json.dumps({
         "location": location,
         "current_time": "unknown"
     })
 
+# 工具定义
+tools = registry.schemas()
+
 @app.route('/api/ai-time', methods=['POST'])
 def ai_time():
     """使用 AI 处理自然语言请求，获取城市时间"""
@@ -74,10 +91,17 @@ def ai_time():
     if not user_query:
         return jsonify({'error': '请求内容不能为空'}), 400
     
+    # 本地快速路径：只询问一个城市的当前时间时直接用模板回答，不调用模型
+    if fast_path_enabled:
+        answer = intent_matcher.answer(user_query)
+        if answer is not None:
+            return jsonify({'response': answer})
+    
+    deadline = time.monotonic() + request_timeout
     try:
         # 第一步：发送用户请求给 AI，获取工具调用
         messages = [{"role": "user", "content": user_query}]
-        response = openai.chat.completions.create(
+        response = upstream(deadline).chat.completions.create(
             model=model_name,
             messages=messages,
             tools=tools,
@@ -89,21 +113,32 @@ def ai_time():
         
         # 第二步：处理工具调用
         if response_message.tool_calls:
+            # 问题只是查询时间、且所有工具调用都找到了城市时，用模板生成最终回复
+            template_replies = [] if template_reply_enabled and intent_matcher.is_time_lookup(user_query) else None
             for tool_call in response_message.tool_calls:
+                if template_replies is None:
+                    break
+                match = None
                 if tool_call.function.name == "get_current_time":
-                    tool_args = json.loads(tool_call.function.arguments)
-                    time_response = get_current_time(tool_args["location"])
-                    messages.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": "get_current_time",
-                        "content": time_response
-                    })
+                    try:
+                        match = location_resolver.resolve(json.loads(tool_call.function.arguments)["location"])
+                    except (ValueError, KeyError, TypeError):
+                        match = None
+                if match is None:
+                    template_replies = None
                 else:
-                    return jsonify({'error': f'未知的工具调用: {tool_call.function.name}'}), 400
+                    template_replies.append(intent_matcher.reply(user_query, match))
+            
+            if template_replies:
+                return jsonify({
+                    'response': "\n".join(template_replies)
+                })
+            
+            # 并发执行所有工具调用，未知工具和出错的工具把错误信息作为结果返回给模型
+            messages.extend(registry.execute(response_message.tool_calls))
             
             # 第三步：获取最终响应
-            final_response = openai.chat.completions.create(
+            final_response = upstream(deadline).chat.completions.create(
                 model=model_name,
                 messages=messages,
             )
@@ -117,6 +152,8 @@ def ai_time():
                 'response': response_message.content
             })
     
+    except (openai.APITimeoutError, TimeoutError):
+        return jsonify({'error': f'调用模型超时（{request_timeout:g} 秒）'}), 504
     except Exception as e:
         return jsonify({'error': f'处理请求时出错: {str(e)}'}), 500
 
@@ -131,11 +168,66 @@ def get_time():
     time_response = json.loads(get_current_time(city))
     return jsonify(time_response)
 
+@app.route('/api/time/batch', methods=['GET', 'POST'])
+def get_time_batch():
+    """批量获取多个城市的当前时间，同一时区的时间只计算一次"""
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if body is None:
+            body = {}
+        if not isinstance(body, dict):
+            return jsonify({'error': 'cities 必须是城市名称列表'}), 400
+        cities = body.get('cities', [])
+    else:
+        cities = request.args.get('cities', '').split(',')
+    if not isinstance(cities, list):
+        return jsonify({'error': 'cities 必须是城市名称列表'}), 400
+    # 非字符串的项不当作城市名称查询，在对应位置返回错误
+    cities = [city.strip() if isinstance(city, str) else city for city in cities]
+    cities = [city for city in cities if city != '']
+    
+    if not cities:
+        return jsonify({'error': '城市名称不能为空'}), 400
+    if len(cities) > max_batch_cities:
+        return jsonify({'error': f'一次最多查询 {max_batch_cities} 个城市'}), 400
+    
+    # 按时区分组，所有城市使用同一时刻
+    matches = [location_resolver.resolve(city) if isinstance(city, str) else None for city in cities]
+    now = datetime.now(timezone.utc)
+    zone_times = {
+        tz: now.astimezone(get_zone(tz)).strftime("%I:%M %p")
+        for tz in {match.timezone for match in matches if match is not None}
+    }
+    results = [
+        {
+            "location": city,
+            "timezone": match.timezone if match else None,
+            "current_time": zone_times[match.timezone] if match else "unknown"
+        } if isinstance(city, str) else {
+            "location": city,
+            "error": "城市名称必须是字符串"
+        }
+        for city, match in zip(cities, matches)
+    ]
+    return jsonify({'results': results})
+
 @app.route('/api/cities', methods=['GET'])
 def get_cities():
-    """获取支持的所有城市列表"""
-    cities = list(TIMEZONE_DATA.keys())
-    return jsonify({'cities': cities})
+    """获取支持的所有城市列表（预先序列化和压缩，支持 ETag/If-None-Match）"""
+    use_gzip = 'gzip' in request.accept_encodings
+    # 压缩和未压缩的内容使用不同的 ETag
+    etag = CITIES_ETAG + ('-gzip' if use_gzip else '')
+    
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(CITIES_GZIP if use_gzip else CITIES_JSON, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={cities_max_age}'
+    response.vary.add('Accept-Encoding')
+    return response
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,126 @@
+# /api/ai-time 的本地意图匹配
+# 调用模型之前，用城市表和一组中英文问法识别"某个城市现在几点"这类简单问题，
+# 能确定时直接用模板回答，不调用模型；模型调用了工具时也可以用模板生成最终回复，省掉第二次模型调用
+
+import re
+from datetime import datetime
+
+from location_resolver import get_zone, normalize
+
+# 中文城市名称 -> timezone_config.json 中的英文名称
+CITY_ALIASES = {
+    "北京": "beijing", "上海": "shanghai", "广州": "guangzhou", "深圳": "shenzhen", "杭州": "hangzhou",
+    "成都": "chengdu", "武汉": "wuhan", "重庆": "chongqing", "南京": "nanjing", "天津": "tianjin",
+    "香港": "hong kong", "台北": "taipei", "东京": "tokyo", "大阪": "osaka", "首尔": "seoul",
+    "新加坡": "singapore", "曼谷": "bangkok", "雅加达": "jakarta", "马尼拉": "manila", "德里": "delhi",
+    "孟买": "mumbai", "迪拜": "dubai", "莫斯科": "moscow", "开罗": "cairo", "伦敦": "london",
+    "巴黎": "paris", "柏林": "berlin", "马德里": "madrid", "罗马": "rome", "阿姆斯特丹": "amsterdam",
+    "维也纳": "vienna", "斯德哥尔摩": "stockholm", "雅典": "athens", "纽约": "new york",
+    "洛杉矶": "los angeles", "芝加哥": "chicago", "休斯顿": "houston", "费城": "philadelphia",
+    "凤凰城": "phoenix", "多伦多": "toronto", "温哥华": "vancouver", "蒙特利尔": "montreal",
+    "墨西哥城": "mexico city", "圣保罗": "sao paulo", "里约热内卢": "rio de janeiro",
+    "布宜诺斯艾利斯": "buenos aires", "悉尼": "sydney", "墨尔本": "melbourne", "奥克兰": "auckland",
+    "约翰内斯堡": "johannesburg", "内罗毕": "nairobi", "利雅得": "riyadh", "卡拉奇": "karachi", "达卡": "dhaka",
+}
+
+# 询问当前时间的问法
+TIME_PATTERN = re.compile(
+    r"几点|几点钟|什么时间|啥时间|时间|what time|whats the time|what s the time|current time|local time"
+    r"|time now|\btime\b"
+)
+# 出现这些词说明问题不只是查询当前时间（时差、换算、日程等），交给模型处理
+EXCLUDE_PATTERN = re.compile(
+    r"时差|相差|差几|换算|转换|如果|会议|开会|明天|昨天|后天|航班|飞|天气|日期|几号|星期"
+    r"|\b(?:difference|differ|convert|between|tomorrow|yesterday|meeting|flight|weather|date|day|when|if)\b"
+)
+# 去掉城市名称和时间问法后允许剩下的客套词
+FILLER_PATTERN = re.compile(
+    r"请问|请|告诉我|帮我|查一下|查询|一下|现在|目前|此刻|当前|当地|本地|的|是|吗|呢|呀|啊|了|在|多少"
+    r"|\b(?:please|tell|me|now|right|is|it|the|in|at|what|whats|s|currently|current|local|of|for|do|you"
+    r"|know|can|could|check|today)\b"
+)
+# 剩余字符数不超过该值时认为问题只是在问时间
+MAX_RESIDUAL_CHARS = 2
+
+
+def with_aliases(timezones, aliases=CITY_ALIASES):
+    """
+    在城市表中加入中文别名（只加入城市表中存在的城市）
+    """
+    merged = dict(timezones)
+    for alias, key in aliases.items():
+        if key in timezones:
+            merged.setdefault(alias, timezones[key])
+    return merged
+
+
+def is_chinese(text):
+    return any("一" <= c <= "鿿" for c in text)
+
+
+class IntentMatcher:
+    """
+    本地意图匹配
+    Args:
+        resolver: 包含中文别名的 LocationResolver
+        aliases: 中文城市名称 -> 英文名称，用于生成回复中的城市名称
+    """
+
+    def __init__(self, resolver, aliases=CITY_ALIASES):
+        self.resolver = resolver
+        self.aliases = aliases
+        self.chinese_names = {}
+        for alias, key in aliases.items():
+            self.chinese_names.setdefault(key, alias)
+
+    def is_time_lookup(self, query):
+        """
+        问题是否只是查询当前时间（不涉及时差、换算、日程等）
+        """
+        text = normalize(query)
+        return bool(TIME_PATTERN.search(text)) and not EXCLUDE_PATTERN.search(text)
+
+    def match(self, query):
+        """
+        判断问题是否只是询问一个城市的当前时间
+        Returns:
+            城市的 Match，不能确定时返回None（交给模型处理）
+        """
+        if not self.is_time_lookup(query):
+            return None
+        text = normalize(query)
+        matches = self.resolver.find_all(query)
+        # 多个城市（即使时区相同）或没有精确匹配的城市都交给模型；中文别名与英文名称算同一个城市
+        if len({self.aliases.get(match.key, match.key) for match in matches}) != 1:
+            return None
+        for match in matches:
+            text = text.replace(normalize(match.key), " ")
+        text = FILLER_PATTERN.sub(" ", TIME_PATTERN.sub(" ", text))
+        if len(text.replace(" ", "")) > MAX_RESIDUAL_CHARS:
+            return None
+        return matches[0]
+
+    def answer(self, query):
+        """
+        能确定时返回模板回复，否则返回None
+        """
+        match = self.match(query)
+        if match is None:
+            return None
+        return self.reply(query, match)
+
+    def reply(self, query, match, now=None):
+        """
+        用模板生成回复，回复的语言与问题一致
+        Args:
+            query: 用户的问题
+            match: 城市的 Match
+            now: 当地时间，默认为当前时间
+        """
+        now = now or datetime.now(get_zone(match.timezone))
+        key = self.aliases.get(match.key, match.key)
+        if is_chinese(query):
+            city = self.chinese_names.get(key, key.title())
+            period = "上午" if now.hour < 12 else "下午"
+            return f"{city}现在的时间是{period}{now.hour % 12 or 12}点{now.minute:02d}分"
+        return f"The current time in {key.title()} is {now.strftime('%I:%M %p')}."
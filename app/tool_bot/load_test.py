@@ -0,0 +1,95 @@
+# /api/ai-time 压测脚本（只用标准库）
+# 依次用不同的并发数发送请求，报告每个并发数下的吞吐量(请求/秒)和 p50/p95/p99 延迟
+#
+# 用法（配合 stub_model_server.py）：
+#   python load_test.py --concurrency 1,4,16,64 --requests 200
+#   python load_test.py --url http://127.0.0.1:8000 --query "北京现在几点？"   # 本地快速路径
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+# 默认问题不会命中本地快速路径和模板回复，每个请求调用两次模型
+DEFAULT_QUERY = "北京和纽约的时差是多少？"
+
+
+def worker(url, query, count, latencies, errors, lock):
+    """
+    在一个连接上（keep-alive）依次发送 count 个请求
+    """
+    parsed = urlparse(url)
+    body = json.dumps({"query": query}).encode("utf-8")
+    connection = None
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=120)
+            connection.request("POST", "/api/ai-time", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+            if response.getheader("Connection", "").lower() == "close":
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException):
+            ok = False
+            if connection is not None:
+                connection.close()
+            connection = None
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+    if connection is not None:
+        connection.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_level(url, query, concurrency, total):
+    """
+    用 concurrency 个并发连接发送 total 个请求
+    Returns:
+        (成功的延迟列表, 失败数, 总耗时)
+    """
+    latencies, errors, lock = [], [0], threading.Lock()
+    counts = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+    threads = [
+        threading.Thread(target=worker, args=(url, query, count, latencies, errors, lock))
+        for count in counts if count
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="压测 /api/ai-time")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="服务地址")
+    parser.add_argument("--query", default=DEFAULT_QUERY, help="请求中的问题")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="并发数，逗号分隔")
+    parser.add_argument("--requests", type=int, default=200, help="每个并发数发送的请求数")
+    args = parser.parse_args()
+
+    print(f"{'并发数':>6} {'请求数':>6} {'失败':>5} {'请求/秒':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}")
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        total = max(args.requests, concurrency)
+        latencies, errors, elapsed = run_level(args.url, args.query, concurrency, total)
+        if not latencies:
+            print(f"{concurrency:>6} {total:>6} {errors:>5}  全部失败")
+            continue
+        print(f"{concurrency:>6} {total:>6} {errors:>5} {len(latencies) / elapsed:>9.1f} "
+              f"{percentile(latencies, 0.5) * 1000:>9.1f} {percentile(latencies, 0.95) * 1000:>9.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.1f}")
@@ -0,0 +1,221 @@
+# 城市名称 -> 时区解析
+# 加载时把 timezone_config.json 中的城市名称预编译成 Aho-Corasick 自动机，一次扫描找出文本中出现的
+# 所有城市名称并优先取最长匹配（"new york city" 优先于 "york"，结果与字典顺序无关）；
+# 没有精确匹配时用三元组(trigram)倒排索引找候选，再按编辑相似度做模糊匹配，容忍拼写错误；
+# ZoneInfo 实例按时区名称缓存
+
+import json
+import unicodedata
+from collections import defaultdict, deque, namedtuple
+from difflib import SequenceMatcher
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+# 解析结果：配置中的城市名称、时区、匹配得分（精确匹配为1.0）
+Match = namedtuple("Match", ["key", "timezone", "score"])
+
+# 模糊匹配的最低编辑相似度（difflib ratio，"tokio" 与 "tokyo" 为0.8）
+DEFAULT_FUZZY_THRESHOLD = 0.8
+# 作为模糊匹配候选的最低三元组Jaccard相似度，以及每个词窗口最多比较的候选数
+MIN_TRIGRAM_SIMILARITY = 0.2
+MAX_FUZZY_CANDIDATES = 5
+# 模糊匹配时查询文本中最多连续取几个词与城市名称比较，以及参与比较的最短长度
+MAX_WINDOW_WORDS = 4
+MIN_FUZZY_LENGTH = 4
+
+
+@lru_cache(maxsize=None)
+def get_zone(timezone):
+    """
+    获取（缓存的）ZoneInfo 实例
+    """
+    return ZoneInfo(timezone)
+
+
+def normalize(text, strip_accents=True):
+    """
+    规范化文本：小写、去掉重音符号（josé -> jose）、标点替换为空格并合并空白
+    """
+    text = unicodedata.normalize("NFKD" if strip_accents else "NFKC", text.lower())
+    if strip_accents:
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    text = "".join(c if c.isalnum() else " " for c in text)
+    return " ".join(text.split())
+
+
+def _is_word_char(c):
+    # 只有拉丁字母和数字需要检查词边界，中文等字符之间没有空格
+    return c.isascii() and c.isalnum()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class LocationResolver:
+    """
+    城市名称解析器
+    Args:
+        timezones: {城市名称: 时区}，即 timezone_config.json 中的 timezones
+        fuzzy_threshold: 模糊匹配的最低相似度，设置为None禁用模糊匹配
+    """
+
+    def __init__(self, timezones, fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.keys = {}  # 规范化名称 -> (配置中的名称, 时区)
+        for key, timezone in timezones.items():
+            normalized = normalize(key)
+            if normalized:
+                self.keys.setdefault(normalized, (key, timezone))
+        # 带重音符号的名称同时按原写法保留（"san josé" 与 "san jose" 是不同的城市）
+        for key, timezone in timezones.items():
+            accented = normalize(key, strip_accents=False)
+            if accented and accented not in self.keys:
+                self.keys[accented] = (key, timezone)
+        self._build_automaton()
+        self._build_trigram_index()
+
+    @classmethod
+    def from_config(cls, path="timezone_config.json", **kwargs):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["timezones"], **kwargs)
+
+    def resolve(self, location):
+        """
+        解析文本中的城市
+        Returns:
+            Match，找不到时返回None
+        """
+        text = normalize(location)
+        if not text:
+            return None
+        accented = normalize(location, strip_accents=False)
+        match = self._exact(accented) if accented != text else None
+        if match is None:
+            match = self._exact(text)
+        if match is None and self.fuzzy_threshold is not None:
+            match = self._fuzzy(text)
+        return match
+
+    def find_all(self, location):
+        """
+        找出文本中精确出现的所有城市（不做模糊匹配），被更长的匹配包含的名称不计入
+        Returns:
+            按出现位置排列的 Match 列表，同一城市只出现一次
+        """
+        text = normalize(location, strip_accents=False)
+        spans = list(self._scan(text))
+        if not spans:
+            text = normalize(location)
+            spans = list(self._scan(text))
+        spans.sort(key=lambda span: (span[0], -span[1]))
+        matches, covered_end, seen = [], 0, set()
+        for start, end, normalized in spans:
+            if end <= covered_end:
+                continue
+            covered_end = end
+            key, timezone = self.keys[normalized]
+            if key not in seen:
+                seen.add(key)
+                matches.append(Match(key, timezone, 1.0))
+        return matches
+
+    def _build_automaton(self):
+        # goto[state] 为 字符 -> 下一状态；output[state] 为在该状态结束的名称（包括经失败链接得到的）
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for normalized in self.keys:
+            state = 0
+            for c in normalized:
+                if c not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][c] = len(self._goto) - 1
+                state = self._goto[state][c]
+            self._output[state].append(normalized)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and c not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(c, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _scan(self, text):
+        """
+        扫描一遍文本，产出所有出现的城市名称 (起始位置, 结束位置, 规范化名称)
+        拉丁字母的名称必须是完整的单词（"jerome" 不会匹配 "rome"）
+        """
+        state = 0
+        for end, c in enumerate(text, 1):
+            while state and c not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(c, 0)
+            for normalized in self._output[state]:
+                start = end - len(normalized)
+                if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(normalized[0]):
+                    continue
+                if end < len(text) and _is_word_char(text[end]) and _is_word_char(normalized[-1]):
+                    continue
+                yield start, end, normalized
+
+    def _exact(self, text):
+        """
+        取文本中最长、最靠前的城市名称
+        """
+        best, best_rank = None, None
+        for start, end, normalized in self._scan(text):
+            rank = (end - start, -start)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = normalized, rank
+        if best is None:
+            return None
+        key, timezone = self.keys[best]
+        return Match(key, timezone, 1.0)
+
+    def _build_trigram_index(self):
+        self._trigrams = {}
+        self._index = defaultdict(list)
+        for normalized in self.keys:
+            grams = trigrams(normalized)
+            self._trigrams[normalized] = grams
+            for gram in grams:
+                self._index[gram].append(normalized)
+
+    def _fuzzy(self, text):
+        """
+        取文本中连续的1~MAX_WINDOW_WORDS个词，通过三元组倒排索引找Jaccard相似度最高的几个候选城市，
+        再按编辑相似度取最高的
+        """
+        words = text.split()
+        best, best_score = None, 0.0
+        for size in range(1, min(MAX_WINDOW_WORDS, len(words)) + 1):
+            for start in range(len(words) - size + 1):
+                window = " ".join(words[start:start + size])
+                if len(window) < MIN_FUZZY_LENGTH:
+                    continue
+                grams = trigrams(window)
+                shared = defaultdict(int)
+                for gram in grams:
+                    for normalized in self._index.get(gram, ()):
+                        shared[normalized] += 1
+                candidates = []
+                for normalized, count in shared.items():
+                    similarity = count / (len(grams) + len(self._trigrams[normalized]) - count)
+                    if similarity >= MIN_TRIGRAM_SIMILARITY:
+                        candidates.append((similarity, normalized))
+                for _, normalized in sorted(candidates, reverse=True)[:MAX_FUZZY_CANDIDATES]:
+                    score = SequenceMatcher(None, window, normalized).ratio()
+                    if score > best_score:
+                        best, best_score = normalized, score
+        if best is None or best_score < self.fuzzy_threshold:
+            return None
+        key, timezone = self.keys[best]
+        return Match(key, timezone, round(best_score, 3))
@@ -0,0 +1,105 @@
+# 生产环境服务
+# 用 waitress（多线程WSGI服务器，Windows/Linux通用）运行 app.py 中的 Flask 应用：
+# 多个请求在线程池中并发处理，等待模型响应时不会阻塞其他请求；
+# 收到 SIGTERM/SIGINT 时对新请求返回503，等待处理中的请求完成（最多 TOOL_BOT_DRAIN_TIMEOUT 秒）后关闭监听socket并退出；
+# 只使用 waitress 的公开接口（create_server、run、close）
+#
+# 用法：
+#   python serve.py
+#   TOOL_BOT_THREADS=64 TOOL_BOT_PORT=8000 python serve.py
+
+import os
+import signal
+import threading
+import time
+
+from waitress import create_server
+from werkzeug.wsgi import ClosingIterator
+
+from app import app
+
+
+class InFlightTracker:
+    """
+    统计处理中的请求数的WSGI中间件，停机时对新请求返回503
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.in_flight = 0
+        self.draining = False
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            if self.draining:
+                start_response("503 Service Unavailable", [("Content-Type", "application/json; charset=utf-8")])
+                return ['{"error": "服务正在停止"}'.encode("utf-8")]
+            self.in_flight += 1
+        try:
+            # 响应发送完（close）后才算请求结束
+            return ClosingIterator(self.wsgi_app(environ, start_response), self._finish)
+        except Exception:
+            self._finish()
+            raise
+
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def serve(wsgi_app, host="0.0.0.0", port=5000, threads=32, drain_timeout=30.0):
+    """
+    运行服务直到收到停止信号
+    Args:
+        wsgi_app: WSGI应用
+        host: 监听地址
+        port: 监听端口
+        threads: 处理请求的线程数（同时处理的请求数）
+        drain_timeout: 停机时等待处理中请求完成的最长时间（秒）
+    """
+    tracker = InFlightTracker(wsgi_app)
+    # backlog 和 connection_limit 留出余量，压测时高并发的连接在队列中等待而不是被拒绝
+    server = create_server(tracker, host=host, port=port, threads=threads,
+                           backlog=1024, connection_limit=max(100, threads * 8))
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, request_stop)
+
+    # 事件循环（公开的 run()）在后台线程中运行，主线程等待停止信号并负责停机；
+    # waitress 的事件循环线程和工作线程都是守护线程，serve() 返回后进程即可退出
+    loop = threading.Thread(target=server.run, name="waitress-loop", daemon=True)
+    loop.start()
+    print(f"Serving on http://{host}:{port} with {threads} threads")
+    # 带超时等待，让主线程能及时处理信号
+    while not stop.wait(0.5):
+        if not loop.is_alive():
+            raise RuntimeError("waitress 事件循环异常退出")
+
+    # 新请求返回503，事件循环继续运行，把处理中请求的响应写完
+    print(f"Shutting down, waiting for {tracker.in_flight} in-flight requests...")
+    tracker.draining = True
+    deadline = time.monotonic() + drain_timeout
+    while tracker.in_flight > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    # 响应体交给 waitress 后还需要一点时间写到socket
+    time.sleep(0.5)
+    if tracker.in_flight:
+        print(f"Drain timeout, {tracker.in_flight} requests abandoned")
+    server.close()
+    print("Server stopped")
+
+
+if __name__ == "__main__":
+    serve(
+        app,
+        host=os.getenv("TOOL_BOT_HOST", "0.0.0.0"),
+        port=int(os.getenv("TOOL_BOT_PORT", "5000")),
+        threads=int(os.getenv("TOOL_BOT_THREADS", "32")),
+        drain_timeout=float(os.getenv("TOOL_BOT_DRAIN_TIMEOUT", "30")),
+    )
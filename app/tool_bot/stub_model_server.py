@@ -0,0 +1,86 @@
+# 本地模拟模型服务（只用标准库），用于压测，不调用真实模型
+# 实现 OpenAI 兼容的 POST /v1/chat/completions：请求带 tools 时返回 get_current_time 工具调用，
+# 否则返回一段固定的回复；每次响应前等待 --delay 秒模拟模型延迟
+#
+# 用法：
+#   python stub_model_server.py --port 18081 --delay 0.5
+#   QWEN_BASE_URL=http://127.0.0.1:18081/v1 QWEN_APP_KEY=stub TOOL_CALL_MODEL=stub python serve.py
+
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def completion(model, message, finish_reason):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    # 默认的 listen backlog 只有5，高并发时连接会被拒绝
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 以便客户端复用连接
+    protocol_version = "HTTP/1.1"
+    delay = 0.5
+    location = "Tokyo"
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.delay)
+        model = body.get("model", "stub")
+        if body.get("tools"):
+            payload = completion(model, {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:8]}",
+                    "type": "function",
+                    "function": {"name": "get_current_time", "arguments": json.dumps({"location": self.location})},
+                }],
+            }, "tool_calls")
+        else:
+            payload = completion(model, {"role": "assistant", "content": "stub reply"}, "stop")
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地模拟模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--delay", type=float, default=0.5, help="每次响应前等待的秒数")
+    parser.add_argument("--location", default="Tokyo", help="工具调用中返回的城市")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    StubHandler.location = args.location
+    server = StubServer((args.host, args.port), StubHandler)
+    print(f"Stub model server on http://{args.host}:{args.port}/v1 (delay {args.delay}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
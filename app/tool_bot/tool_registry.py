@@ -0,0 +1,193 @@
+# 工具注册表
+# 用装饰器注册Python函数，根据函数签名和 Annotated 类型注解生成 OpenAI 工具定义
+# （同时识别 semantic_kernel 的 kernel_function 设置的名称和描述）；
+# 模型一轮返回的所有工具调用在线程池中并发执行，每个工具单独超时，纯函数工具的结果按TTL缓存
+
+import inspect
+import json
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+DEFAULT_TIMEOUT = 10.0
+MAX_CACHE_ENTRIES = 1024
+
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+
+def _parameter_schema(hint):
+    """
+    把类型注解转换为JSON Schema，Annotated 中的字符串作为参数描述
+    """
+    description = None
+    if typing.get_origin(hint) is typing.Annotated:
+        hint, *extras = typing.get_args(hint)
+        description = next((extra for extra in extras if isinstance(extra, str)), None)
+    origin, args = typing.get_origin(hint), typing.get_args(hint)
+    if origin is typing.Union and type(None) in args:
+        # Optional[X]
+        hint = next(arg for arg in args if arg is not type(None))
+        origin, args = typing.get_origin(hint), typing.get_args(hint)
+    if origin is typing.Literal:
+        schema = {"type": JSON_TYPES.get(type(args[0]), "string"), "enum": list(args)}
+    else:
+        schema = {"type": JSON_TYPES.get(origin or hint, "string")}
+    if description:
+        schema["description"] = description
+    return schema
+
+
+class Tool:
+    """
+    已注册的工具
+    """
+
+    def __init__(self, func, name, description, timeout, cache_ttl):
+        self.func = func
+        self.name = name
+        self.description = description
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.signature = inspect.signature(func)
+        hints = typing.get_type_hints(func, include_extras=True)
+        properties, required = {}, []
+        for parameter in self.signature.parameters.values():
+            properties[parameter.name] = _parameter_schema(hints.get(parameter.name, str))
+            if parameter.default is inspect.Parameter.empty:
+                required.append(parameter.name)
+        self.parameters = {"type": "object", "properties": properties, "required": required}
+
+    def schema(self):
+        return {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters},
+        }
+
+
+class ToolRegistry:
+    """
+    工具注册表
+    Args:
+        max_workers: 执行工具的线程数
+        default_timeout: 工具默认的超时时间（秒）
+    """
+
+    def __init__(self, max_workers=8, default_timeout=DEFAULT_TIMEOUT):
+        self.tools = {}
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._cache = {}  # (工具名称, 参数JSON) -> (过期时间, 结果)
+        self._cache_lock = threading.Lock()
+
+    def tool(self, func=None, *, name=None, description=None, timeout=None, cache_ttl=None):
+        """
+        注册工具的装饰器，可以直接使用 @registry.tool 或带参数 @registry.tool(timeout=5, cache_ttl=60)
+        Args:
+            name: 工具名称，默认使用 kernel_function 的名称或函数名
+            description: 工具描述，默认使用 kernel_function 的描述或文档字符串的第一行
+            timeout: 超时时间（秒），默认使用注册表的 default_timeout
+            cache_ttl: 结果缓存的秒数，只用于相同参数结果相同的纯函数工具，默认不缓存
+        """
+        def register(func):
+            tool_name = name or getattr(func, "__kernel_function_name__", None) or func.__name__
+            tool_description = (
+                description
+                or getattr(func, "__kernel_function_description__", None)
+                or (inspect.getdoc(func) or "").split("\n")[0]
+            )
+            self.tools[tool_name] = Tool(
+                func, tool_name, tool_description, timeout or self.default_timeout, cache_ttl
+            )
+            return func
+
+        return register(func) if func is not None else register
+
+    def schemas(self):
+        """
+        返回所有工具的定义，用于 chat.completions.create(tools=...)
+        """
+        return [tool.schema() for tool in self.tools.values()]
+
+    def call(self, name, arguments):
+        """
+        同步调用一个工具
+        Args:
+            name: 工具名称
+            arguments: 参数的JSON字符串或字典
+        Returns:
+            工具结果字符串，出错时为包含 error 的JSON
+        """
+        future = self._submit(name, arguments)
+        if isinstance(future, str):
+            return future
+        return self._result(name, future, time.monotonic() + self.tools[name].timeout)
+
+    def execute(self, tool_calls):
+        """
+        并发执行模型一轮返回的所有工具调用，总耗时取决于最慢的工具而不是所有工具之和
+        未知工具、参数错误、超时和异常都作为工具结果返回给模型，不会中断请求
+        Args:
+            tool_calls: response_message.tool_calls
+        Returns:
+            与 tool_calls 顺序一致的 role=tool 消息列表
+        """
+        started = time.monotonic()
+        futures = [self._submit(call.function.name, call.function.arguments) for call in tool_calls]
+        messages = []
+        for call, future in zip(tool_calls, futures):
+            name = call.function.name
+            if isinstance(future, str):
+                content = future
+            else:
+                content = self._result(name, future, started + self.tools[name].timeout)
+            messages.append({"tool_call_id": call.id, "role": "tool", "name": name, "content": content})
+        return messages
+
+    def _submit(self, name, arguments):
+        """
+        提交工具调用，返回 Future；未知工具、参数错误或命中缓存时直接返回结果字符串
+        """
+        tool = self.tools.get(name)
+        if tool is None:
+            return json.dumps({"error": f"未知的工具: {name}"}, ensure_ascii=False)
+        try:
+            kwargs = json.loads(arguments or "{}") if isinstance(arguments, str) else dict(arguments or {})
+            tool.signature.bind(**kwargs)
+        except (ValueError, TypeError) as e:
+            return json.dumps({"error": f"工具 {name} 的参数错误: {e}"}, ensure_ascii=False)
+
+        if tool.cache_ttl:
+            key = (name, json.dumps(kwargs, sort_keys=True, ensure_ascii=False))
+            now = time.monotonic()
+            with self._cache_lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry[0] > now:
+                    return entry[1]
+            return self._executor.submit(self._run_cached, tool, kwargs, key)
+        return self._executor.submit(self._run, tool, kwargs)
+
+    def _run(self, tool, kwargs):
+        result = tool.func(**kwargs)
+        return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+
+    def _run_cached(self, tool, kwargs, key):
+        result = self._run(tool, kwargs)
+        with self._cache_lock:
+            if len(self._cache) >= MAX_CACHE_ENTRIES:
+                now = time.monotonic()
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                if len(self._cache) >= MAX_CACHE_ENTRIES:
+                    self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (time.monotonic() + tool.cache_ttl, result)
+        return result
+
+    def _result(self, name, future, deadline):
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # 线程无法强制中止，超时的工具在后台执行完后结果被丢弃
+            return json.dumps({"error": f"工具 {name} 超时"}, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({"error": f"工具 {name} 执行失败: {e}"}, ensure_ascii=False)
@@ -0,0 +1 @@
+# 各个应用共享的工具模块
@@ -0,0 +1,85 @@
+# 共享的LLM/嵌入客户端工厂
+# 按 (base_url, api_key) 缓存客户端，所有调用复用同一个HTTP连接池（keep-alive），
+# 避免每次请求都重新建立TCP/TLS连接
+
+import os
+import threading
+
+import httpx
+import openai
+
+# 服务商对应的环境变量（与 .env-examples 一致），按顺序使用第一组都已配置的变量
+PROVIDERS = {
+    "qwen": [("QWEN_APP_KEY", "QWEN_BASE_URL")],
+    "deepseek": [("API_KEY", "BASE_URL"), ("DEEPSEEK_APP_KEY", "DEEPSEEK_BASE_URL")],
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def resolve_credentials(provider):
+    """
+    从环境变量读取服务商的 api_key 和 base_url
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"未知的服务商: {provider}")
+    for key_var, url_var in PROVIDERS[provider]:
+        api_key, base_url = os.environ.get(key_var), os.environ.get(url_var)
+        if api_key and base_url:
+            return api_key, base_url
+    names = " 或 ".join(f"{key_var}/{url_var}" for key_var, url_var in PROVIDERS[provider])
+    raise ValueError(f"缺少环境变量: {names}")
+
+
+def _http_settings():
+    pool_size = int(os.environ.get("LLM_POOL_SIZE", "20"))
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=float(os.environ.get("LLM_KEEPALIVE_SECONDS", "60"))
+    )
+    timeout = httpx.Timeout(
+        float(os.environ.get("LLM_TIMEOUT", "60")),
+        connect=float(os.environ.get("LLM_CONNECT_TIMEOUT", "10"))
+    )
+    return limits, timeout
+
+
+def get_client(provider="qwen", api_key=None, base_url=None, use_async=False):
+    """
+    获取共享的OpenAI兼容客户端
+    Args:
+        provider: 服务商名称（"qwen" 或 "deepseek"），未显式传入 api_key/base_url 时从环境变量读取
+        api_key: 显式指定的API密钥
+        base_url: 显式指定的服务地址
+        use_async: 为True时返回 AsyncOpenAI 客户端
+    Returns:
+        相同 (base_url, api_key) 复用同一个客户端和连接池；
+        需要不同的超时或重试次数时使用 client.with_options(...)，仍共享连接池
+    """
+    if api_key is None or base_url is None:
+        api_key, base_url = resolve_credentials(provider)
+    base_url = base_url.rstrip("/") + "/"
+    key = (base_url, api_key, use_async)
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            limits, timeout = _http_settings()
+            if use_async:
+                client = openai.AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    http_client=httpx.AsyncClient(limits=limits, timeout=timeout)
+                )
+            else:
+                client = openai.OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    http_client=httpx.Client(limits=limits, timeout=timeout)
+                )
+            _clients[key] = client
+        return client
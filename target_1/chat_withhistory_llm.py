@@ -1,7 +1,12 @@
 from dotenv import load_dotenv
 import os
-from typing import List, Dict, Optional
-from openai import OpenAI
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Deque, List, Dict, Optional
+
+import tiktoken
 from openai._exceptions import (
     AuthenticationError,
     APIError,
@@ -9,6 +14,8 @@ from openai._exceptions import (
     RateLimitError,
 )
 
+from common.llm_clients import get_client
+
 load_dotenv()
 ENV_KEYS = {
     "API_KEY": "DEEPSEEK_APP_KEY",
@@ -17,18 +24,68 @@ ENV_KEYS = {
 }
 
 DEFAULT_MAX_HISTORY = 20
+DEFAULT_MAX_HISTORY_TOKENS = 4000
+DEFAULT_SUMMARY_MAX_TOKENS = 256
 DEFAULT_TIMEOUT = 60
+# every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Update the running summary of an earlier part of a conversation. "
+    "Keep facts, names, numbers and user preferences; drop small talk. "
+    "Reply with the updated summary only."
+)
+
+
+@lru_cache(maxsize=None)
+def _get_encoder(encoding_name: str) -> tiktoken.Encoding:
+    # loading an encoding is slow, do it once per process
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    encoder = _get_encoder(os.getenv("TOKEN_ENCODING", "cl100k_base"))
+    return len(encoder.encode(message["content"] or "", disallowed_special=())) + MESSAGE_OVERHEAD_TOKENS
+
 
 class ChatWithHistoryLLM:
-    def __init__(self, max_history: int = DEFAULT_MAX_HISTORY, timeout: int = DEFAULT_TIMEOUT):
+    def __init__(
+        self,
+        max_history: Optional[int] = DEFAULT_MAX_HISTORY,
+        timeout: int = DEFAULT_TIMEOUT,
+        *,
+        max_history_tokens: int = DEFAULT_MAX_HISTORY_TOKENS,
+        summarize: bool = False,
+        summary_max_tokens: int = DEFAULT_SUMMARY_MAX_TOKENS,
+        summary_executor: Optional[ThreadPoolExecutor] = None,
+        on_evict: Optional[Callable[[List[Dict[str, str]]], None]] = None,
+    ):
         self._validate_and_load_config()
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-            timeout=timeout
-        )
+        # instances with the same config share one client and its connection pool
+        self.client = get_client(api_key=self.api_key, base_url=self.base_url).with_options(timeout=timeout)
+        # the kept messages must fit both the message count (None for no cap) and the token budget
+        self.max_history_tokens = max_history_tokens
         self.max_history = max_history
-        self.history: List[Dict[str, str]] = []
+        # token counts are computed once on append and kept next to the messages,
+        # so eviction only pops from the left and adjusts the running total
+        self.history: Deque[Dict[str, str]] = deque()
+        self._token_counts: Deque[int] = deque()
+        self.history_tokens = 0
+        # evicted turns are folded into a rolling summary by a background worker
+        self.summarize = summarize
+        self.summary_max_tokens = summary_max_tokens
+        self.summary = ""
+        self._pending_summary: List[Dict[str, str]] = []
+        self._summary_running = False
+        self._summary_generation = 0
+        self._summary_lock = threading.Lock()
+        # an owner that outlives this instance (e.g. a session store) can take the evicted
+        # messages and summarize them itself instead of this instance running a worker
+        self._on_evict = on_evict
+        # many instances can share one executor instead of a thread each
+        if summarize and summary_executor is None and on_evict is None:
+            summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._summary_executor = summary_executor
 
     def _validate_and_load_config(self):
         self.api_key = self._get_env(ENV_KEYS["API_KEY"], required=True)
@@ -41,27 +98,100 @@ class ChatWithHistoryLLM:
             raise ValueError(f"Environment variable {key} is required but not set.")
         return value
 
+    def _append(self, message: Dict[str, str]) -> None:
+        tokens = count_message_tokens(message)
+        self.history.append(message)
+        self._token_counts.append(tokens)
+        self.history_tokens += tokens
+
     def _truncate_history(self) -> None:
-        if len(self.history) > self.max_history:
-            # remove oldest messages
-            self.history = self.history[-self.max_history:]
+        evicted = []
+        # remove oldest messages until the budget fits; the latest message is always kept
+        while len(self.history) > 1 and (
+            self.history_tokens > self.max_history_tokens
+            or (self.max_history is not None and len(self.history) > self.max_history)
+        ):
+            evicted.append(self._pop_oldest())
+        # don't start the kept history with an orphaned assistant reply
+        while len(self.history) > 1 and self.history[0]["role"] == "assistant":
+            evicted.append(self._pop_oldest())
+        if evicted and self.summarize:
+            if self._on_evict is not None:
+                self._on_evict(evicted)
+            else:
+                self._schedule_summary(evicted)
+
+    def _pop_oldest(self) -> Dict[str, str]:
+        self.history_tokens -= self._token_counts.popleft()
+        return self.history.popleft()
+
+    def _schedule_summary(self, messages: List[Dict[str, str]]) -> None:
+        with self._summary_lock:
+            self._pending_summary.extend(messages)
+            if self._summary_running:
+                # the running refresh picks up the new messages when it finishes
+                return
+            self._summary_running = True
+        self._summary_executor.submit(self._refresh_summary)
+
+    def _refresh_summary(self) -> None:
+        while True:
+            with self._summary_lock:
+                messages, self._pending_summary = self._pending_summary, []
+                if not messages:
+                    self._summary_running = False
+                    return
+                summary, generation = self.summary, self._summary_generation
+            try:
+                summary = self.summarize_messages(summary, messages)
+            except Exception:
+                # keep the previous summary; the evicted messages are dropped so the backlog stays bounded
+                continue
+            with self._summary_lock:
+                # skip the result if the history was cleared in the meantime
+                if generation != self._summary_generation:
+                    continue
+                self.summary = summary
+
+    def summarize_messages(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        # fold messages into an existing summary with one model call; raises on API errors
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"},
+            ],
+            temperature=0,
+            max_tokens=self.summary_max_tokens,
+        )
+        return (completion.choices[0].message.content or "").strip()
+
+    def _build_messages(self) -> List[Dict[str, str]]:
+        messages = list(self.history)
+        summary = self.summary
+        if summary:
+            # the summary is capped by summary_max_tokens, so the prompt stays within
+            # max_history_tokens + summary_max_tokens (plus an oversized latest message)
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        return messages
 
     def chat(self, user_input) -> str:
         # Append user input to history
         user_input_stripped = user_input.strip()
         if not user_input_stripped:
             raise ValueError("User input cannot be empty.")
-        self.history.append({"role": "user", "content": user_input_stripped})
+        self._append({"role": "user", "content": user_input_stripped})
 
         try:
             self._truncate_history()
             completion = self.client.chat.completions.create(
                 model=self.model,
-                messages=self.history,
+                messages=self._build_messages(),
                 temperature=0.7,
             )
             response = completion.choices[0].message.content
-            self.history.append({"role": "assistant", "content": response})
+            self._append({"role": "assistant", "content": response})
             return response
         except AuthenticationError as auth_err:
             return f"Authentication Error: {str(auth_err)}"
@@ -74,12 +204,34 @@ class ChatWithHistoryLLM:
         except Exception as e:
             return f"An unexpected error occurred: {str(e)}"
     
+    def export_state(self) -> Dict[str, Any]:
+        # plain JSON-serializable state, token counts included so a reload doesn't re-tokenize
+        return {
+            "history": list(self.history),
+            "tokens": list(self._token_counts),
+            "summary": self.summary,
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        self.history = deque(state.get("history", []))
+        self._token_counts = deque(state.get("tokens", []))
+        if len(self._token_counts) != len(self.history):
+            self._token_counts = deque(count_message_tokens(message) for message in self.history)
+        self.history_tokens = sum(self._token_counts)
+        self.summary = state.get("summary", "")
+
     def clear_history(self) -> None:
-        self.history = []
+        self.history.clear()
+        self._token_counts.clear()
+        self.history_tokens = 0
+        with self._summary_lock:
+            self._pending_summary = []
+            self.summary = ""
+            self._summary_generation += 1
     
 if __name__ == "__main__":
     try:
-        chat_llm = ChatWithHistoryLLM()
+        chat_llm = ChatWithHistoryLLM(summarize=os.getenv("CHAT_HISTORY_SUMMARY", "0") == "1")
         while True:
             try:
                 user_input = input("User: ")
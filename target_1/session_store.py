@@ -0,0 +1,237 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from chat_withhistory_llm import ChatWithHistoryLLM
+
+DEFAULT_DB_PATH = "./sessions.sqlite3"
+DEFAULT_MAX_MEMORY_BYTES = 64 * 1024 * 1024
+# rough per-entry cost of the LRU bookkeeping (dict slot, key string, bytes header)
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def pack_state(state: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack_state(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class SessionManager:
+    """Serves many ChatWithHistoryLLM conversations from one process.
+
+    Every turn is written through to SQLite, so a crash loses nothing; recently
+    used sessions are also cached in memory as zlib-compressed JSON in an LRU under
+    max_memory_bytes, and the least recently used ones are dropped from the cache and
+    loaded back lazily on their next turn. A session is only turned back into
+    a ChatWithHistoryLLM for the duration of a chat() call. chat() calls on
+    different sessions run concurrently; calls on the same session are serialized
+    by a lock that exists only while the session is in use.
+    With summarize=True the evicted turns of a session are folded into its stored
+    summary by one refresh at a time, each starting from the latest stored summary.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+        **llm_kwargs: Any,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.llm_kwargs = llm_kwargs
+        # summaries are refreshed by the manager, not by the short-lived per-turn instances;
+        # the workers are shared by all sessions instead of a thread per session
+        self._summary_executor: Optional[ThreadPoolExecutor] = None
+        if llm_kwargs.get("summarize"):
+            self._summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session-summary")
+        self._summary_lock = threading.Lock()
+        self._pending_summary: Dict[str, List[Dict[str, str]]] = {}
+        self._summarizing = set()
+        # bumped by clear() so a refresh that started before it doesn't write a stale summary
+        self._summary_generations: Dict[str, int] = {}
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        self._hot_bytes = 0
+        # guards only the LRU bookkeeping, never held during a model call
+        self._lru_lock = threading.Lock()
+        # one lock per session in use (with its number of holders and waiters), removed when unused
+        self._session_locks: Dict[str, List[Any]] = {}
+        self._session_locks_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # every turn commits; in WAL mode NORMAL still survives a process crash without an fsync per commit
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, state BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+    def chat(self, session_id: str, user_input: str) -> str:
+        with self._session_lock(session_id):
+            llm = self._new_llm(session_id)
+            llm.load_state(self._load(session_id))
+            response = llm.chat(user_input)
+            self._store(session_id, llm.export_state())
+            return response
+
+    def history(self, session_id: str):
+        with self._session_lock(session_id):
+            return self._load(session_id).get("history", [])
+
+    def clear(self, session_id: str) -> None:
+        with self._session_lock(session_id):
+            with self._summary_lock:
+                self._pending_summary.pop(session_id, None)
+                self._summary_generations[session_id] = self._summary_generations.get(session_id, 0) + 1
+            with self._lru_lock:
+                blob = self._hot.pop(session_id, None)
+                if blob is not None:
+                    self._hot_bytes -= len(blob) + ENTRY_OVERHEAD_BYTES
+            with self._db_lock:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lru_lock:
+            hot, hot_bytes = len(self._hot), self._hot_bytes
+        with self._db_lock:
+            stored = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"hot_sessions": hot, "hot_bytes": hot_bytes, "stored_sessions": stored}
+
+    def close(self) -> None:
+        # pending summary refreshes write through _store, so let them finish first
+        if self._summary_executor is not None:
+            self._summary_executor.shutdown(wait=True)
+        with self._db_lock:
+            self._db.close()
+
+    @contextmanager
+    def _session_lock(self, session_id: str):
+        with self._session_locks_lock:
+            entry = self._session_locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._session_locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._session_locks[session_id]
+
+    def _new_llm(self, session_id: str) -> ChatWithHistoryLLM:
+        # the client is shared (get_client caches it), so a per-turn instance is cheap
+        return ChatWithHistoryLLM(
+            on_evict=lambda messages: self._schedule_summary(session_id, messages),
+            **self.llm_kwargs,
+        )
+
+    def _load(self, session_id: str) -> Dict[str, Any]:
+        with self._lru_lock:
+            blob = self._hot.get(session_id)
+            if blob is not None:
+                self._hot.move_to_end(session_id)
+        if blob is None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+            blob = row[0] if row else None
+        return unpack_state(blob) if blob is not None else {}
+
+    def _store(self, session_id: str, state: Dict[str, Any]) -> None:
+        blob = pack_state(state)
+        # written through first, so the cache never holds a state the database doesn't
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO sessions (session_id, state) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state",
+                (session_id, blob),
+            )
+            self._db.commit()
+        with self._lru_lock:
+            previous = self._hot.pop(session_id, None)
+            if previous is not None:
+                self._hot_bytes -= len(previous) + ENTRY_OVERHEAD_BYTES
+            self._hot[session_id] = blob
+            self._hot_bytes += len(blob) + ENTRY_OVERHEAD_BYTES
+            while self._hot_bytes > self.max_memory_bytes and len(self._hot) > 1:
+                _, evicted_blob = self._hot.popitem(last=False)
+                self._hot_bytes -= len(evicted_blob) + ENTRY_OVERHEAD_BYTES
+
+    def _schedule_summary(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        # called from chat() with the session lock held
+        with self._summary_lock:
+            self._pending_summary.setdefault(session_id, []).extend(messages)
+            if session_id in self._summarizing:
+                # the running refresh picks up the new messages when it finishes
+                return
+            self._summarizing.add(session_id)
+        self._summary_executor.submit(self._refresh_summary, session_id)
+
+    def _refresh_summary(self, session_id: str) -> None:
+        # at most one refresh per session runs at a time, so every refresh folds its
+        # messages into the summary written by the previous one and none is lost
+        llm = None
+        while True:
+            with self._summary_lock:
+                messages = self._pending_summary.pop(session_id, None)
+                if not messages:
+                    self._summarizing.discard(session_id)
+                    return
+                generation = self._summary_generations.get(session_id, 0)
+            with self._session_lock(session_id):
+                summary = self._load(session_id).get("summary", "")
+            try:
+                llm = llm or self._new_llm(session_id)
+                # the model call runs without the session lock, so chat() isn't blocked
+                summary = llm.summarize_messages(summary, messages)
+            except Exception:
+                # keep the previous summary; the evicted messages are dropped so the backlog stays bounded
+                continue
+            with self._session_lock(session_id):
+                with self._summary_lock:
+                    if generation != self._summary_generations.get(session_id, 0):
+                        continue
+                state = self._load(session_id)
+                if state:
+                    state["summary"] = summary
+                    self._store(session_id, state)
+
+
+if __name__ == "__main__":
+    manager = SessionManager(
+        db_path=os.getenv("CHAT_SESSION_DB", DEFAULT_DB_PATH),
+        summarize=os.getenv("CHAT_HISTORY_SUMMARY", "0") == "1",
+    )
+    session_id = "default"
+    print("Type ':session <id>' to switch conversations, 'exit' to quit.")
+    try:
+        while True:
+            try:
+                user_input = input(f"[{session_id}] User: ")
+            except KeyboardInterrupt:
+                print("\nExiting chat.")
+                break
+            if user_input.lower() in ["exit", "quit"]:
+                break
+            if user_input.startswith(":session "):
+                session_id = user_input.split(maxsplit=1)[1].strip()
+                continue
+            if user_input.lower() == "clear":
+                manager.clear(session_id)
+                print("Chat history cleared.")
+                continue
+            try:
+                print(f"Assistant: {manager.chat(session_id, user_input)}")
+            except ValueError as ve:
+                print(f"Input Error: {str(ve)}")
+    finally:
+        manager.close()